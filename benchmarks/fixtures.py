@@ -0,0 +1,59 @@
+"""Synthetic JWST i2d-style FITS files with real celestial WCS headers."""
+import os
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+
+# (filter, pixel scale in arcsec, rotation in degrees, fraction of the reference field covered)
+CHANNELS = [
+    ('f150w2', 0.031, 0.0, 1.0),
+    ('f300m', 0.063, 0.5, 1.0),
+    ('f335m', 0.063, -0.3, 0.9),
+    ('f2100w', 0.11, 1.2, 0.35),
+]
+
+
+def make_wcs(shape, ra=283.396, dec=33.029, scale_arcsec=0.031, rotation=0.0):
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crval = [ra, dec]
+    wcs.wcs.crpix = [(shape[1] + 1) / 2, (shape[0] + 1) / 2]
+    scale = scale_arcsec / 3600.0
+    theta = np.deg2rad(rotation)
+    wcs.wcs.cd = scale * np.array([[-np.cos(theta), np.sin(theta)],
+                                   [np.sin(theta), np.cos(theta)]])
+    return wcs
+
+def make_i2d(path, shape, scale_arcsec=0.031, rotation=0.0, seed=0, ra=283.396, dec=33.029):
+    """Write a float32 i2d-like file: empty primary HDU plus a SCI extension."""
+    rng = np.random.default_rng(seed)
+    ny, nx = shape
+    y, x = np.mgrid[0:ny, 0:nx]
+    # a ring nebula on a noisy background, with a NaN border like real mosaics
+    r = np.hypot(x - nx / 2, y - ny / 2) / (min(shape) / 4)
+    data = (np.exp(-((r - 1) ** 2) * 8) * 50 + rng.normal(0.5, 0.1, shape)).astype(np.float32)
+    edge = max(1, min(shape) // 50)
+    data[:edge] = np.nan
+    data[:, -edge:] = np.nan
+    header = make_wcs(shape, ra, dec, scale_arcsec, rotation).to_header()
+    header['PIXAR_A2'] = scale_arcsec ** 2
+    header['BUNIT'] = 'MJy/sr'
+    primary = fits.PrimaryHDU()
+    primary.header['TELESCOP'] = 'JWST'
+    fits.HDUList([primary, fits.ImageHDU(data, header=header, name='SCI')]).writeto(path, overwrite=True)
+    return path
+
+def make_mosaic_set(directory, shape=(2048, 2048), channels=CHANNELS):
+    """Write one i2d per channel, all centred on the same sky position.
+
+    The first channel is the reference; others differ in pixel scale,
+    rotation and sky coverage, like mixed NIRCam/MIRI inputs.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    ref_scale = channels[0][1]
+    for k, (name, scale, rotation, coverage) in enumerate(channels):
+        side = [max(16, int(n * coverage * ref_scale / scale)) for n in shape]
+        path = os.path.join(directory, f'bench_{name}_i2d.fits')
+        paths.append(make_i2d(path, tuple(side), scale, rotation, seed=k))
+    return paths
@@ -0,0 +1,208 @@
+"""Local stand-in for the MAST /api/v0/invoke endpoint.
+
+Serves Mast.Name.Lookup, Mast.Caom.Cone, Mast.Caom.Products and
+Mast.Caom.Filtered (plus Mast.Caom.Filtered.Position) with synthetic,
+deterministic rows, MAST-style paging and optional injected latency, so
+the query paths can be benchmarked without touching the real archive.
+"""
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote_plus
+
+COLLECTIONS = ['JWST', 'HST', 'TESS', 'GALEX', 'SPITZER_SHA']
+INSTRUMENTS = {'JWST': ['NIRCAM/IMAGE', 'MIRI/IMAGE', 'NIRSPEC/MSA'], 'HST': ['WFC3/IR', 'ACS/WFC'],
+               'TESS': ['Photometer'], 'GALEX': ['GALEX'], 'SPITZER_SHA': ['IRAC']}
+FILTERS = ['F150W2', 'F212N', 'F300M', 'F335M', 'F480M', 'F1800W', 'F2100W', 'NUV', 'IRAC1']
+
+OBS_FIELDS = [
+    ('intentType', 'string'), ('obs_collection', 'string'), ('provenance_name', 'string'),
+    ('instrument_name', 'string'), ('project', 'string'), ('filters', 'string'),
+    ('wavelength_region', 'string'), ('target_name', 'string'), ('target_classification', 'string'),
+    ('obs_id', 'string'), ('s_ra', 'float'), ('s_dec', 'float'), ('dataproduct_type', 'string'),
+    ('proposal_pi', 'string'), ('calib_level', 'int'), ('t_min', 'float'), ('t_max', 'float'),
+    ('t_exptime', 'float'), ('em_min', 'float'), ('em_max', 'float'), ('obs_title', 'string'),
+    ('t_obs_release', 'float'), ('proposal_id', 'string'), ('proposal_type', 'string'),
+    ('sequence_number', 'int'), ('s_region', 'string'), ('jpegURL', 'string'), ('dataURL', 'string'),
+    ('dataRights', 'string'), ('mtFlag', 'boolean'), ('srcDen', 'float'), ('obsid', 'string'),
+    ('objID', 'string'), ('distance', 'float'),
+]
+PRODUCT_FIELDS = [
+    ('obsID', 'string'), ('obs_collection', 'string'), ('dataproduct_type', 'string'),
+    ('obs_id', 'string'), ('description', 'string'), ('type', 'string'), ('dataURI', 'string'),
+    ('productType', 'string'), ('productGroupDescription', 'string'),
+    ('productSubGroupDescription', 'string'), ('productDocumentationURL', 'string'),
+    ('project', 'string'), ('prvversion', 'string'), ('proposal_id', 'string'),
+    ('productFilename', 'string'), ('size', 'int'), ('parent_obsid', 'string'),
+    ('dataRights', 'string'), ('calib_level', 'int'), ('filters', 'string'),
+]
+PRODUCT_TYPES = ['SCIENCE', 'SCIENCE', 'AUXILIARY', 'PREVIEW', 'INFO']
+SUFFIXES = ['i2d.fits', 'cal.fits', 'asn.json', 'i2d.jpg', 'segm.fits', 'cat.ecsv']
+
+
+def _fields(spec):
+    return [{'name': n, 'type': t} for n, t in spec]
+
+def observation_row(i, ra=283.396, dec=33.029):
+    rng = random.Random(i)
+    collection = COLLECTIONS[i % len(COLLECTIONS)]
+    obs_ra = ra + rng.uniform(-0.2, 0.2)
+    obs_dec = dec + rng.uniform(-0.2, 0.2)
+    return {
+        'intentType': 'science', 'obs_collection': collection, 'provenance_name': 'CALJWST',
+        'instrument_name': rng.choice(INSTRUMENTS[collection]), 'project': collection,
+        'filters': rng.choice(FILTERS), 'wavelength_region': 'INFRARED',
+        'target_name': f'TARGET-{i % 97}', 'target_classification': None,
+        'obs_id': f'jw{i:05d}-o{i % 50:03d}_t001', 's_ra': obs_ra, 's_dec': obs_dec,
+        'dataproduct_type': 'image', 'proposal_pi': 'Doe, Jane', 'calib_level': rng.choice([1, 2, 3]),
+        't_min': 59700 + i * 0.01, 't_max': 59700.5 + i * 0.01, 't_exptime': rng.uniform(100, 5000),
+        'em_min': 1400.0, 'em_max': 1700.0, 'obs_title': 'Synthetic observation',
+        't_obs_release': 59800.0, 'proposal_id': str(1000 + i % 300), 'proposal_type': 'GO',
+        'sequence_number': None, 's_region': f'CIRCLE ICRS {obs_ra:.6f} {obs_dec:.6f} 0.02',
+        'jpegURL': None, 'dataURL': None, 'dataRights': 'PUBLIC', 'mtFlag': False,
+        'srcDen': 5000.0, 'obsid': str(80000000 + i), 'objID': str(90000000 + i),
+        'distance': 0.0,
+    }
+
+def product_row(obsid, k):
+    suffix = SUFFIXES[k % len(SUFFIXES)]
+    filename = f'jw{obsid}_{k:04d}_{suffix}'
+    return {
+        'obsID': str(obsid), 'obs_collection': 'JWST', 'dataproduct_type': 'image',
+        'obs_id': f'jw{obsid}', 'description': 'synthetic product', 'type': 'S',
+        'dataURI': f'mast:JWST/product/{filename}', 'productType': PRODUCT_TYPES[k % len(PRODUCT_TYPES)],
+        'productGroupDescription': 'Minimum Recommended Products',
+        'productSubGroupDescription': suffix.split('.')[0].upper(),
+        'productDocumentationURL': '', 'project': 'CALJWST', 'prvversion': '1.14.0',
+        'proposal_id': '1714', 'productFilename': filename, 'size': 1000000 + k,
+        'parent_obsid': str(obsid), 'dataRights': 'PUBLIC', 'calib_level': 3 if 'i2d' in suffix else 2,
+        'filters': FILTERS[k % len(FILTERS)],
+    }
+
+
+class MastStub:
+    """Threaded local MAST server. Use as a context manager; .url is the invoke URL."""
+
+    def __init__(self, rows=5000, products=40, latency=0.0, host='127.0.0.1', port=0):
+        self.rows = rows
+        self.products = products
+        self.latency = latency
+        self.requests = 0
+        self._observations = [observation_row(i) for i in range(rows)]
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8')
+                request = json.loads(unquote_plus(body.split('=', 1)[1]))
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                payload = json.dumps(stub.respond(request)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    payload = gzip.compress(payload, compresslevel=1)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/v0/invoke'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    #----------------  services  --------------------
+
+    def respond(self, request):
+        service = request.get('service')
+        params = request.get('params', {})
+        if service == 'Mast.Name.Lookup':
+            return {'resolvedCoordinate': [{'ra': 283.396, 'decl': 33.029, 'canonicalName': params.get('input')}],
+                    'status': ''}
+        if service == 'Mast.Caom.Cone':
+            return self._page(request, _fields(OBS_FIELDS), self._observations)
+        if service == 'Mast.Caom.Products':
+            obsids = str(params.get('obsid', '')).split(',')
+            rows = [product_row(obsid.strip(), k) for obsid in obsids if obsid.strip()
+                    for k in range(self.products)]
+            return self._page(request, _fields(PRODUCT_FIELDS), rows)
+        if service in ('Mast.Caom.Filtered', 'Mast.Caom.Filtered.Position'):
+            rows = self._filter(self._observations, params.get('filters', []))
+            if params.get('columns') == 'COUNT_BIG(*)':
+                return {'status': 'COMPLETE', 'fields': [{'name': 'Column1', 'type': 'long'}],
+                        'data': [{'Column1': len(rows)}],
+                        'paging': {'page': 1, 'pageSize': 1, 'pagesFiltered': 1, 'rows': 1,
+                                   'rowsFiltered': 1, 'rowsTotal': 1}}
+            fields = _fields(OBS_FIELDS)
+            columns = params.get('columns', '*')
+            if columns != '*':
+                wanted = [c.strip() for c in columns.split(',')]
+                fields = [f for f in fields if f['name'] in wanted]
+                rows = [{c: r[c] for c in wanted if c in r} for r in rows]
+            return self._page(request, fields, rows)
+        return {'status': 'ERROR', 'msg': f'unknown service {service}', 'data': [], 'fields': []}
+
+    @staticmethod
+    def _filter(rows, filters):
+        for f in filters:
+            name, values = f['paramName'], f['values']
+            if values and isinstance(values[0], dict):
+                lo, hi = values[0]['min'], values[0]['max']
+                rows = [r for r in rows if r.get(name) is not None and lo <= r[name] <= hi]
+            elif values:
+                rows = [r for r in rows if r.get(name) in values]
+        return rows
+
+    @staticmethod
+    def _page(request, fields, rows):
+        pagesize = int(request.get('pagesize') or len(rows) or 1)
+        page = int(request.get('page') or 1)
+        data = rows[(page - 1) * pagesize: page * pagesize]
+        return {'status': 'COMPLETE', 'msg': '', 'fields': fields, 'data': data,
+                'paging': {'page': page, 'pageSize': pagesize,
+                           'pagesFiltered': -(-len(rows) // pagesize), 'rows': len(data),
+                           'rowsFiltered': len(rows), 'rowsTotal': len(rows)}}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a local MAST stand-in.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--products', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    with MastStub(args.rows, args.products, args.latency, port=args.port) as stub:
+        print(f"serving {stub.url}")
+        threading.Event().wait()
@@ -0,0 +1,167 @@
+"""Offline benchmarks for the query and imaging hot paths.
+
+    python benchmarks/run.py --out results.json
+    python benchmarks/run.py --out new.json --compare results.json
+
+Query benchmarks run against benchmarks.mast_stub; imaging benchmarks use
+synthetic i2d files from benchmarks.fixtures; startup benchmarks time the
+import of the entry modules in a fresh interpreter (python -X importtime).
+Results are written as JSON so runs can be compared.
+"""
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mast_stub import MastStub
+from fixtures import make_mosaic_set
+import mast_request
+from mast_request import mast_query
+from mast_cone_search import cone_search
+from get_products import product_request, extract_science_products
+from reprojection import reproject_channels
+from stretch import to_uint16
+from tiff_writer import write_tiled
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return {'min_s': min(times), 'median_s': statistics.median(times), 'repeat': repeat}
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# entry modules whose cold import time is tracked
+STARTUP_MODULES = ['name_resolver', 'mast_cone_search', 'get_fits']
+
+def import_time(module):
+    # cumulative import time of module in a fresh interpreter, in seconds
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    for line in reversed(err.splitlines()):
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    raise ValueError(f"no importtime entry for {module}")
+
+def startup_benchmarks(args):
+    results = {}
+    for module in STARTUP_MODULES:
+        try:
+            times = [import_time(module) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"skipping import_{module}: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        results[f'import_{module}'] = {'min_s': min(times), 'median_s': statistics.median(times), 'repeat': args.repeat}
+    return results
+
+def query_benchmarks(args):
+    results = {}
+    with MastStub(rows=args.rows, products=args.products, latency=args.latency) as stub:
+        mast_request.MAST_URL = stub.url
+        lookup = {'service': 'Mast.Name.Lookup', 'params': {'input': 'NGC 6720', 'format': 'json'}}
+        calls = 20
+        results['mast_query'] = timeit(lambda: [mast_query(lookup) for _ in range(calls)], args.repeat)
+        results['mast_query']['calls'] = calls
+        results['cone_search'] = timeit(lambda: cone_search(283.396, 33.029, pagesize=args.rows), args.repeat)
+        results['cone_search']['rows'] = args.rows
+        headers, body = mast_query(product_request('80000000') | {'pagesize': args.products})
+        products = json.loads(body)
+        results['extract_science_products'] = timeit(lambda: extract_science_products(products), args.repeat)
+        results['extract_science_products']['rows'] = len(products['data'])
+    return results
+
+def imaging_benchmarks(args):
+    results = {}
+    shape = (args.size, args.size)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_mosaic_set(tmp, shape)
+        results['reprojection'] = timeit(
+            lambda: reproject_channels(paths, 0, workers=args.workers, tile_size=args.tile_size), args.repeat)
+        results['reprojection'].update(channels=len(paths), shape=list(shape), workers=args.workers)
+        channel = reproject_channels(paths[:2], 0, workers=args.workers)[1]
+        results['to_uint16'] = timeit(lambda: to_uint16(channel, 0.0, 0.01), args.repeat)
+        results['to_uint16']['shape'] = list(channel.shape)
+        rgb = [to_uint16(channel, 0.0, f) for f in (0.01, 0.02, 0.05)]
+        out = os.path.join(tmp, 'bench.tiff')
+        results['tiff_write'] = timeit(lambda: write_tiled(out, rgb), args.repeat)
+        results['tiff_write']['shape'] = list(channel.shape) + [3]
+    return results
+
+def compare(results, baseline, threshold):
+    # print the ratio of each median to the baseline; True if any regressed
+    regressed = False
+    print(f"{'benchmark':28s} {'baseline':>10s} {'current':>10s} {'ratio':>7s}")
+    for name, result in results.items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        ratio = result['median_s'] / old['median_s']
+        flag = '  REGRESSION' if ratio > threshold else ''
+        regressed |= ratio > threshold
+        print(f"{name:28s} {old['median_s']:10.4f} {result['median_s']:10.4f} {ratio:7.2f}{flag}")
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run offline performance benchmarks.")
+    parser.add_argument('--out', default='bench_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2, help="ratio counted as a regression")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=5000, help="rows returned by the cone search stub")
+    parser.add_argument('--products', type=int, default=200, help="products per obsid in the stub")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds of latency the stub adds per request")
+    parser.add_argument('--size', type=int, default=2048, help="edge of the reference synthetic mosaic")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--tile-size', type=int, default=1024)
+    parser.add_argument('--only', choices=['startup', 'query', 'imaging'])
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.only in (None, 'startup'):
+        results.update(startup_benchmarks(args))
+    if args.only in (None, 'query'):
+        results.update(query_benchmarks(args))
+    if args.only in (None, 'imaging'):
+        results.update(imaging_benchmarks(args))
+
+    report = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'cpus': os.cpu_count(), 'args': vars(args)},
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, result in results.items():
+        print(f"{name:28s} median {result['median_s']:.4f} s  (min {result['min_s']:.4f} s)")
+    print(f"wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import mast_request
+from mast_request import get_session
+from metrics import span
+from utils import os, time, hashlib, threading, ThreadPoolExecutor, as_completed
+
+DOWNLOAD_URL = 'https://mast.stsci.edu/api/v0.1/Download/file'
+DOWNLOAD_DIR = 'mastDownload'
+CHUNK_SIZE = 1024 * 1024
+
+class DownloadProgress:
+    """Thread-safe byte counter that reports aggregate throughput."""
+
+    def __init__(self, total_files, report_every=5.0):
+        self.total_files = total_files
+        self.report_every = report_every
+        self.files_done = 0
+        self.bytes_done = 0
+        self.start = time.monotonic()
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def add(self, nbytes):
+        with self._lock:
+            self.bytes_done += nbytes
+            now = time.monotonic()
+            if now - self._last_report < self.report_every:
+                return
+            self._last_report = now
+        print(self.summary())
+
+    def file_done(self):
+        with self._lock:
+            self.files_done += 1
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        mb = self.bytes_done / 1024 ** 2
+        return (f"{self.files_done}/{self.total_files} files, {mb:.1f} MB "
+                f"in {elapsed:.1f} s ({mb / elapsed:.1f} MB/s)")
+
+def local_path(product, download_dir=DOWNLOAD_DIR):
+    """Where astroquery would put this product: <dir>/<collection>/<obs_id>/<file>."""
+    return os.path.join(download_dir, str(product['obs_collection']),
+                        str(product['obs_id']), str(product['productFilename']))
+
+def _hash_file(digest, path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest
+
+def file_digest(path, algorithm='md5'):
+    return _hash_file(hashlib.new(algorithm), path).hexdigest()
+
+def _expected_size(product):
+    # None when unknown: missing, null (masked in a mast_table row) or not positive
+    from utils import np
+    try:
+        value = product['size']
+    except (KeyError, ValueError):
+        return None
+    if value is None or np.ma.is_masked(value):
+        return None
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return size if size > 0 else None
+
+def _expected_checksum(product):
+    for name in ('md5', 'checksum'):
+        try:
+            value = product[name]
+        except (KeyError, ValueError):
+            continue
+        if value:
+            return str(value)
+    return None
+
+def verify_file(path, size=None, checksum=None, algorithm='md5', digest=None):
+    """Check a local file against the expected size and digest, when known.
+
+    digest is the file's hex digest if the caller already has it, which
+    saves reading the file again.
+    """
+    if not os.path.exists(path):
+        return False
+    if size is not None and os.path.getsize(path) != size:
+        return False
+    if checksum is not None and (digest or file_digest(path, algorithm)) != checksum.lower():
+        return False
+    return True
+
+def download_file(product, download_dir=DOWNLOAD_DIR, progress=None, algorithm='md5'):
+    """Download one product, resuming a previous .part file with an HTTP range request."""
+    with span('download') as sp:
+        result = _download_file(product, download_dir, progress, algorithm)
+        sp.set(status=result['Status'])
+        sp.add('bytes', result['bytes'])
+        return result
+
+def _download_file(product, download_dir, progress, algorithm):
+    path = local_path(product, download_dir)
+    size = _expected_size(product)
+    checksum = _expected_checksum(product)
+    result = {'productFilename': str(product['productFilename']), 'Local Path': path,
+              'Status': 'COMPLETE', 'Message': None, 'bytes': 0, 'digest': None}
+    if verify_file(path, size, checksum, algorithm):
+        result['Status'] = 'SKIPPED'
+        result['digest'] = checksum.lower() if checksum else None
+        if progress:
+            progress.file_done()
+        return result
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = path + '.part'
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if size is not None and offset > size:
+        offset = 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    # the digest is computed as the chunks arrive, so the file is not read again
+    digest = hashlib.new(algorithm)
+    try:
+        with get_session().get(DOWNLOAD_URL, params={'uri': str(product['dataURI'])},
+                               headers=headers, stream=True, timeout=mast_request.TIMEOUT) as resp:
+            if resp.status_code == 416:
+                # nothing left to fetch; fall through to verification
+                _hash_file(digest, part)
+            else:
+                resp.raise_for_status()
+                if offset and resp.status_code != 206:
+                    offset = 0  # server ignored the range; start over
+                if offset:
+                    _hash_file(digest, part)
+                with open(part, 'ab' if offset else 'wb') as f:
+                    for chunk in resp.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        result['bytes'] += len(chunk)
+                        if progress:
+                            progress.add(len(chunk))
+    except Exception as e:
+        result['Status'] = 'ERROR'
+        result['Message'] = str(e)
+        return result
+
+    result['digest'] = digest.hexdigest()
+    if not verify_file(part, size, checksum, algorithm, result['digest']):
+        result['Status'] = 'ERROR'
+        result['Message'] = 'size or checksum mismatch'
+        os.remove(part)
+        return result
+    os.replace(part, path)
+    if progress:
+        progress.file_done()
+    return result
+
+def download_products(products, download_dir=DOWNLOAD_DIR, max_workers=4, algorithm='md5', verbose=True):
+    """Download products in parallel, skipping files already present and valid.
+
+    products is any sequence of product rows (astropy Table or dicts) with
+    dataURI, productFilename, obs_collection, obs_id and optionally size.
+    Returns one result dict per product, in input order; 'digest' holds the
+    hex digest of each downloaded file (of skipped ones only when the
+    product row carries a checksum).
+    """
+    products = list(products)
+    progress = DownloadProgress(len(products), report_every=5.0 if verbose else float('inf'))
+    results = [None] * len(products)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(download_file, product, download_dir, progress, algorithm): i
+                   for i, product in enumerate(products)}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if verbose:
+                print(f"{result['Status']}: {result['Local Path']}"
+                      + (f" ({result['Message']})" if result['Message'] else ""))
+    if verbose:
+        print(progress.summary())
+    return results
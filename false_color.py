@@ -0,0 +1,221 @@
+# Batch false-color pipeline for JWST i2d mosaics: read -> reproject ->
+# stretch -> write.
+#
+# A manifest (JSON) lists many composites:
+#
+#   {"defaults": {"fwhite": 0.01, "stretch": "asinh"},
+#    "composites": [
+#        {"name": "ring_rgb", "files": ["r_i2d.fits", "g_i2d.fits", "b_i2d.fits"],
+#         "fblack": [0.0006, 0.00045, 0.0002], "fwhite": [0.0012, 0.0025, 0.005]},
+#        {"name": "m57", "mode": "channels", "files": ["M57_f150w2_i2d.fits", ...]},
+#        {"name": "nircam_miri", "frame": "intersection", "files": [...]}]}
+#
+# Composites run concurrently on a thread pool and every reprojection tile
+# goes to one shared process pool. Headers and WCS objects are loaded once
+# per file, and a channel reprojected onto a given reference is computed
+# once even when several composites use it. Only the part of the frame a
+# channel's footprint covers is reprojected, and "frame": "intersection"
+# crops the output to where every channel has data.
+#
+#   python false_color.py manifest.json --workers 32 --composite-workers 4
+
+import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from fits_loader import SciImage
+from reprojection import reproject_channel
+from footprint import common_box, crop_frame, full_box
+from reproject_cache import ReprojectCache
+from stretch import to_uint16
+from tiff_writer import write_tiled
+
+# settings a composite inherits unless the manifest overrides them
+DEFAULTS = {
+    'mode': 'rgb',          # 'rgb': one RGB tiff; 'channels': one grayscale tiff per file
+    'ref': 0,               # index of the file whose WCS is the common frame
+    'frame': 'ref',         # 'ref': the whole reference frame; 'intersection': cropped to the overlap
+    'fblack': 0.0,          # black point, fraction of [min, max]; scalar or one per file
+    'fwhite': 1.0,          # white point, fraction of [min, max]; scalar or one per file
+    'stretch': 'linear',    # 'linear', 'asinh' or 'log'
+    'order': 'bilinear',    # reprojection interpolation order
+    'tiff_tile': 512,
+    'compression': None,
+    'levels': 0,
+}
+
+
+def _per_file(value, n):
+    return list(value) if isinstance(value, (list, tuple)) else [value] * n
+
+def output_name(path):
+    # M57_f150w2_i2d.fits -> M57_f150w2_i2d.tiff
+    base = os.path.basename(path)
+    for ext in ('.fits', '.fit'):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+    return base + '.tiff'
+
+
+class Pipeline:
+
+    def __init__(self, workers=None, tile_size=2048, cache_dir='.reproject_cache', composite_workers=2):
+        self.tile_size = tile_size
+        self.composite_workers = composite_workers
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self.cache = ReprojectCache(cache_dir) if cache_dir else None
+        self._images = {}
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    #----------------  read  --------------------
+
+    def image(self, path):
+        # SciImage for path, shared by every composite that uses the file
+        with self._lock:
+            if path not in self._images:
+                self._images[path] = SciImage(path)
+            return self._images[path]
+
+    #----------------  reproject  --------------------
+
+    def frame(self, paths, ref_path, mode='ref'):
+        # (rows, cols) box of ref_path's frame used as the common output frame
+        ref = self.image(ref_path)
+        images = [(ref.wcs, ref.shape)] + [(im.wcs, im.shape) for im in map(self.image, paths)
+                                           if os.path.abspath(im.path) != os.path.abspath(ref_path)]
+        return common_box(images, 0, mode)
+
+    def channel(self, path, ref_path, order='bilinear', box=None):
+        # path reprojected onto ref_path's frame (or the box of it); concurrent
+        # callers asking for the same (path, ref, order, box) wait on a single
+        # computation. Memory-mapped results (the reference itself, cache
+        # entries) are kept for later composites; in-RAM arrays are not.
+        ref = self.image(ref_path)
+        box = box or full_box(ref.shape)
+        key = (os.path.abspath(path), os.path.abspath(ref_path), order,
+               tuple((s.start, s.stop) for s in box))
+        with self._lock:
+            future = self._channels.get(key)
+            owner = future is None
+            if owner:
+                future = self._channels[key] = Future()
+        if not owner:
+            return future.result()
+        mapped = True
+        try:
+            if key[0] == key[1]:
+                result = ref.data[box]
+            else:
+                wcs_out, shape_out = crop_frame(ref.wcs, box) if box != full_box(ref.shape) else (ref.wcs, ref.shape)
+                result = reproject_channel(path, wcs_out, shape_out, self.pool, self.tile_size,
+                                           order, cache=self.cache)
+                mapped = False
+                if self.cache is not None:
+                    # hold the memory-mapped copy rather than the in-RAM array,
+                    # unless the entry has already been evicted again
+                    cached = self.cache.get(self.cache.key(path, wcs_out, shape_out, order))
+                    if cached is not None:
+                        result, mapped = cached, True
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            with self._lock:
+                del self._channels[key]
+            raise
+        if not mapped:
+            with self._lock:
+                del self._channels[key]
+        return result
+
+    #----------------  stretch  --------------------
+
+    @staticmethod
+    def stretch(channel, fblk, fwht, kind='linear'):
+        return to_uint16(channel, fblk, fwht, kind)
+
+    #----------------  write  --------------------
+
+    @staticmethod
+    def write(path, channels, tile=512, compression=None, levels=0):
+        print("saving "+path)
+        write_tiled(path, channels, tile=tile, compression=compression, levels=levels)
+        return path
+
+    #----------------  drive  --------------------
+
+    def run(self, composite, out_dir='.'):
+        # run one composite from the manifest; returns the written paths
+        spec = dict(DEFAULTS, **composite)
+        files = spec['files']
+        fblack = _per_file(spec['fblack'], len(files))
+        fwhite = _per_file(spec['fwhite'], len(files))
+        ref_path = files[spec['ref']]
+        box = self.frame(files, ref_path, spec['frame'])
+        stretched = []
+        for j, path in enumerate(files):
+            channel = self.channel(path, ref_path, spec['order'], box)
+            stretched.append(self.stretch(channel, fblack[j], fwhite[j], spec['stretch']))
+        write_args = (spec['tiff_tile'], spec['compression'], spec['levels'])
+        if spec['mode'] == 'channels':
+            return [self.write(os.path.join(out_dir, output_name(path)), channel, *write_args)
+                    for path, channel in zip(files, stretched)]
+        name = spec.get('output') or spec.get('name', 'composite') + '.tiff'
+        return [self.write(os.path.join(out_dir, name), stretched, *write_args)]
+
+    def run_all(self, composites, out_dir='.'):
+        # run many composites concurrently; returns {name: paths or exception}
+        def run_one(composite):
+            try:
+                return self.run(composite, out_dir)
+            except Exception as e:
+                print(f"composite {composite.get('name')} failed: {e}", file=sys.stderr)
+                return e
+        with ThreadPoolExecutor(max_workers=self.composite_workers) as threads:
+            results = list(threads.map(run_one, composites))
+        return {c.get('name', str(i)): r for i, (c, r) in enumerate(zip(composites, results))}
+
+    def close(self):
+        self.pool.shutdown()
+        with self._lock:
+            self._channels.clear()
+            for image in self._images.values():
+                image.close()
+            self._images.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    defaults = manifest.get('defaults', {})
+    return [dict(defaults, **c) for c in manifest['composites']]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render false-color composites from JWST i2d mosaics.")
+    parser.add_argument('manifest', help="JSON manifest listing the composites")
+    parser.add_argument('--out-dir', default='.', help="directory for the tiff files")
+    parser.add_argument('--workers', type=int, default=None, help="reprojection processes (default: one per CPU)")
+    parser.add_argument('--composite-workers', type=int, default=2, help="composites rendered at once")
+    parser.add_argument('--tile-size', type=int, default=2048, help="reprojection tile edge in pixels")
+    parser.add_argument('--cache-dir', default='.reproject_cache', help="reprojection cache ('' to disable)")
+    args = parser.parse_args(argv)
+
+    composites = load_manifest(args.manifest)
+    os.makedirs(args.out_dir, exist_ok=True)
+    with Pipeline(args.workers, args.tile_size, args.cache_dir or None, args.composite_workers) as pipe:
+        results = pipe.run_all(composites, args.out_dir)
+    failed = [name for name, r in results.items() if isinstance(r, Exception)]
+    print(f"{len(results) - len(failed)} of {len(results)} composites written")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
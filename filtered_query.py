@@ -1,5 +1,8 @@
-from mast_request import mast_query
-from utils import json, pp
+from mast_request import mast_query, mast_query_pages, mast_query_stream, mast_query_many, decode_response, set_filters, set_min_max
+from mast_table import mast_table
+from utils import logging, np, vstack
+
+log = logging.getLogger(__name__)
 
 def filtered_count(filters):
     mashup_request = {
@@ -11,21 +14,142 @@ def filtered_count(filters):
         }
     }
     headers, out_string = mast_query(mashup_request)
-    count = json.loads(out_string)
-    pp.pprint(count)
+    count = decode_response(out_string, 'Mast.Caom.Filtered')
+    log.debug("count: %s", count)
     return count
 
-def filtered_query(filters):
-    mashup_request = {
+def filtered_row_count(filters):
+    """Number of rows matching filters, from a COUNT_BIG(*) request."""
+    count = filtered_count(filters)
+    return int(next(iter(count['data'][0].values())))
+
+def filtered_request(filters, columns="*"):
+    if not isinstance(columns, str):
+        columns = ",".join(columns)
+    return {
         "service": "Mast.Caom.Filtered",
         "format": "json",
         "params": {
-            "columns": "*",
+            "columns": columns,
             "filters": filters
         }
     }
-    headers, out_string = mast_query(mashup_request)
-    data = json.loads(out_string)
-    print("Query status:", data['status'])
-    pp.pprint(data['data'][0])
+
+def filtered_query(filters):
+    data = mast_query_stream(filtered_request(filters))
+    log.info("Query status: %s", data['status'])
+    log.debug("first row: %s", data['data'][:1])
     return data
+
+def filtered_query_pages(filters, pagesize=2000, prefetch=True):
+    """Yield the full filtered query result page by page."""
+    yield from mast_query_pages(filtered_request(filters), pagesize, prefetch)
+
+# bounds on the planner's page size
+MIN_PAGE_ROWS = 500
+MAX_PAGE_ROWS = 50000
+MAX_CONCURRENCY = 8
+MAX_ROWS = 200000
+
+def plan_filtered_query(count, pagesize=None, max_concurrency=MAX_CONCURRENCY):
+    """Pick page size and parallelism for a result of count rows."""
+    if pagesize is None:
+        # one page per worker, within [MIN_PAGE_ROWS, MAX_PAGE_ROWS]
+        pagesize = min(MAX_PAGE_ROWS, max(MIN_PAGE_ROWS, -(-count // max_concurrency)))
+    pages = max(1, -(-count // pagesize))
+    return {'count': count, 'pagesize': pagesize, 'pages': pages,
+            'concurrency': min(pages, max_concurrency)}
+
+def filtered_query_planned(filters, columns="*", max_rows=MAX_ROWS, confirm=None,
+                           pagesize=None, max_concurrency=MAX_CONCURRENCY):
+    """Count first, then fetch every page of a filtered query concurrently.
+
+    Above max_rows the query is refused unless confirm(plan) returns True.
+    columns limits the columns sent over the wire. Returns one response
+    dict with the pages' rows concatenated in order.
+    """
+    plan = plan_filtered_query(filtered_row_count(filters), pagesize, max_concurrency)
+    log.info("Filtered query plan: %s", plan)
+    if plan['count'] > max_rows and not (confirm and confirm(plan)):
+        raise ValueError(f"filtered query matches {plan['count']} rows, above max_rows={max_rows}")
+
+    request = filtered_request(filters, columns)
+    requests = [dict(request, pagesize=plan['pagesize'], page=page) for page in range(1, plan['pages'] + 1)]
+    results = mast_query_many(requests, plan['concurrency'])
+
+    data = None
+    for page, result in enumerate(results, start=1):
+        if isinstance(result, Exception):
+            raise RuntimeError(f"filtered query page {page} failed: {result}") from result
+        headers, out_string = result
+        page_data = decode_response(out_string, request['service'])
+        if data is None:
+            data = page_data
+        else:
+            data['data'].extend(page_data['data'])
+    data['paging'] = {'page': 1, 'pageSize': len(data['data']), 'pagesFiltered': 1,
+                      'rows': len(data['data']), 'rowsFiltered': plan['count'], 'rowsTotal': plan['count']}
+    log.info("Query status: %s, %d rows", data['status'], len(data['data']))
+    return data
+
+def filtered_position_request(ra, dec, radius, filters, columns="*"):
+    request = filtered_request(filters, columns)
+    request["service"] = "Mast.Caom.Filtered.Position"
+    request["params"]["position"] = f"{ra}, {dec}, {radius}"
+    return request
+
+def filtered_position_search(ra, dec, radius, filters, columns="*", pagesize=2000):
+    """All observations in a cone that match filters, as one Table."""
+    request = filtered_position_request(ra, dec, radius, filters, columns)
+    tables = [mast_table(page) for page in mast_query_pages(request, pagesize)]
+    table = tables[0] if len(tables) == 1 else vstack(tables)
+    log.info("Found %d observations", len(table))
+    return table
+
+def filter_name_match(value, names):
+    """True if any of names is one of the ';'-separated elements of a 'filters' value.
+
+    Whole elements are compared, so F150W matches 'CLEAR;F150W' but not 'F150W2'.
+    """
+    wanted = {name.upper() for name in names}
+    return any(token.strip() in wanted for token in str(value).upper().split(';'))
+
+def filter_name_mask(column, names):
+    """Vectorized mask of rows whose 'filters' value includes any of names.
+
+    JWST combines optical elements in one value (e.g. 'CLEAR;F480M'), so an
+    exact-match server-side filter would miss them. Each distinct value is
+    matched once and the result broadcast back to the rows.
+    """
+    values, inverse = np.unique(np.asarray(column, dtype=str), return_inverse=True)
+    hits = np.array([filter_name_match(v, names) for v in values], dtype=bool)
+    return hits[inverse.ravel()]
+
+def find_observations(ra, dec, radius=0.2, obs_collection=None, instrument_name=None,
+                      calib_level=None, filter_names=None, columns="*", released_after=None,
+                      data_rights=None):
+    """Cone search with collection, instrument and calib level pushed down to MAST.
+
+    calib_level is a level or a (min, max) pair. filter_names cannot be
+    matched server-side (see filter_name_mask) and is applied locally.
+    released_after (MJD) keeps only observations with a later t_obs_release.
+    data_rights (e.g. 'PUBLIC') keeps only observations with those dataRights.
+    """
+    params = {}
+    if obs_collection:
+        params["obs_collection"] = [obs_collection] if isinstance(obs_collection, str) else list(obs_collection)
+    if instrument_name:
+        params["instrument_name"] = [instrument_name] if isinstance(instrument_name, str) else list(instrument_name)
+    if data_rights:
+        params["dataRights"] = [data_rights.upper()] if isinstance(data_rights, str) else [d.upper() for d in data_rights]
+    filters = set_filters(params)
+    if calib_level is not None:
+        lo, hi = calib_level if isinstance(calib_level, (tuple, list)) else (calib_level, calib_level)
+        filters.append({"paramName": "calib_level", "values": set_min_max(lo, hi)})
+    if released_after is not None:
+        filters.append({"paramName": "t_obs_release", "values": set_min_max(released_after, 1e6)})
+    table = filtered_position_search(ra, dec, radius, filters, columns)
+    if filter_names and len(table):
+        names = [filter_names] if isinstance(filter_names, str) else filter_names
+        table = table[filter_name_mask(table["filters"], names)]
+    return table
@@ -0,0 +1,58 @@
+# Lazy access to the SCI extension of JWST i2d FITS files.
+#
+# Only the SCI header is parsed up front (enough for the WCS and the image
+# shape). Pixels are memory-mapped on first use and can be read one tile at
+# a time, and close() drops the mapping and the file handle right away.
+
+from astropy.io import fits
+from astropy.wcs import WCS
+from metrics import span
+
+
+class SciImage:
+
+    def __init__(self, path, ext='SCI'):
+        self.path = path
+        self.ext = ext
+        with span('fits_load'):
+            self.header = fits.getheader(path, ext)
+            self.wcs = WCS(self.header)
+        self.shape = (self.header['NAXIS2'], self.header['NAXIS1'])
+        self._hdul = None
+        self._data = None
+
+    @property
+    def data(self):
+        # memory-mapped SCI pixels; nothing is read until it is indexed
+        if self._data is None:
+            with span('fits_map'):
+                self._hdul = fits.open(self.path, memmap=True, lazy_load_hdus=True)
+                self._data = self._hdul[self.ext].data
+        return self._data
+
+    def tile(self, rows, cols):
+        # copy one (rows, cols) slice block into memory
+        return self.data[rows, cols].copy()
+
+    def tiles(self, tile_size=2048):
+        # yield ((rows, cols), block) over the whole image
+        ny, nx = self.shape
+        for y in range(0, ny, tile_size):
+            for x in range(0, nx, tile_size):
+                rows, cols = slice(y, min(y + tile_size, ny)), slice(x, min(x + tile_size, nx))
+                yield (rows, cols), self.tile(rows, cols)
+
+    def close(self):
+        self._data = None
+        if self._hdul is not None:
+            self._hdul.close()
+            self._hdul = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f"SciImage({self.path!r}, shape={self.shape})"
@@ -0,0 +1,77 @@
+# Sky footprints of FITS images and their overlap with an output frame.
+#
+# The outline of an input image (its outer pixel edges, sampled densely
+# enough to follow the projection) is carried through world coordinates
+# into the output frame. Its bounding box there is the only part of the
+# frame a reprojection can fill; everything outside comes out NaN anyway.
+# Boxes are (rows, cols) slice pairs, the same form tile_slices uses.
+
+import numpy as np
+
+EDGE_SAMPLES = 256   # points per image edge
+MARGIN = 2           # output pixels added around each box
+
+
+def full_box(shape):
+    return (slice(0, shape[0]), slice(0, shape[1]))
+
+def box_shape(box):
+    rows, cols = box
+    return (rows.stop - rows.start, cols.stop - cols.start)
+
+def edge_pixels(shape, samples=EDGE_SAMPLES):
+    # (x, y) pixel coordinates along the outer edges of an image of shape
+    ny, nx = shape
+    xs = np.linspace(-0.5, nx - 0.5, samples)
+    ys = np.linspace(-0.5, ny - 0.5, samples)
+    x = np.concatenate([xs, xs, np.full(samples, -0.5), np.full(samples, nx - 0.5)])
+    y = np.concatenate([np.full(samples, -0.5), np.full(samples, ny - 0.5), ys, ys])
+    return x, y
+
+def footprint_box(wcs_in, shape_in, wcs_out, shape_out, margin=MARGIN, samples=EDGE_SAMPLES):
+    # box of the output frame covered by the input image, None if they don't
+    # overlap; the whole frame when the outline can't be mapped (e.g. it
+    # leaves the projection's valid hemisphere)
+    x, y = edge_pixels(shape_in, samples)
+    ox, oy = wcs_out.world_to_pixel_values(*wcs_in.pixel_to_world_values(x, y))
+    ox, oy = np.asarray(ox), np.asarray(oy)
+    if not (np.all(np.isfinite(ox)) and np.all(np.isfinite(oy))):
+        return full_box(shape_out)
+    ny, nx = shape_out
+    y0 = max(0, int(np.floor(oy.min() + 0.5)) - margin)
+    y1 = min(ny, int(np.ceil(oy.max() + 0.5)) + margin)
+    x0 = max(0, int(np.floor(ox.min() + 0.5)) - margin)
+    x1 = min(nx, int(np.ceil(ox.max() + 0.5)) + margin)
+    if y0 >= y1 or x0 >= x1:
+        return None
+    return (slice(y0, y1), slice(x0, x1))
+
+def box_intersection(boxes):
+    if any(b is None for b in boxes):
+        return None
+    y0, y1 = max(b[0].start for b in boxes), min(b[0].stop for b in boxes)
+    x0, x1 = max(b[1].start for b in boxes), min(b[1].stop for b in boxes)
+    if y0 >= y1 or x0 >= x1:
+        return None
+    return (slice(y0, y1), slice(x0, x1))
+
+def common_box(images, ref_indx=0, mode='ref'):
+    # box of the reference frame to use as the common output frame for
+    # images, a list of (wcs, shape) pairs:
+    #   'ref'          - the whole reference frame
+    #   'intersection' - only where every input has coverage
+    wcs_ref, shape_ref = images[ref_indx]
+    if mode == 'ref':
+        return full_box(shape_ref)
+    if mode != 'intersection':
+        raise ValueError(f"unknown frame {mode!r}")
+    boxes = [footprint_box(wcs, shape, wcs_ref, shape_ref)
+             for j, (wcs, shape) in enumerate(images) if j != ref_indx]
+    box = box_intersection(boxes) if boxes else full_box(shape_ref)
+    if box is None:
+        raise ValueError("the inputs do not overlap the reference frame")
+    return box
+
+def crop_frame(wcs, box):
+    # (wcs, shape) of the box cut out of a frame
+    return wcs[box], box_shape(box)
@@ -1,15 +1,150 @@
-from astroquery.mast import Observations
-from astropy.io import fits
-from astropy.table import conf
-import matplotlib.pyplot as plt
-import numpy as np
+# Startup stays light so MCP clients get a fast handshake: astroquery, numpy,
+# astropy and matplotlib are imported inside the functions that use them.
 from mcp.server.fastmcp import FastMCP
 from typing import Any
-import httpx
+import asyncio
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from download_manager import download_products
+from get_products import get_observation_products
 
 mcp = FastMCP("JWST")
-#define mcp tool
+
+OBS_COLUMNS = ['obsid', 'obs_id', 'target_name', 'instrument_name', 'filters', 'calib_level', 't_exptime', 's_ra', 's_dec']
+PRODUCT_COLUMNS = ['productFilename', 'productSubGroupDescription', 'dataproduct_type', 'calib_level', 'size']
+
+# background download jobs, polled with download_status
+_jobs = {}
+_job_pool = ThreadPoolExecutor(max_workers=2)
+# product tables from list_products, so downloads don't have to query again
+_products = {}
+
+def _value(value):
+    import numpy as np
+    if np.ma.is_masked(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+def _rows(table, columns, limit):
+    """Project a table onto columns and return at most limit plain-dict rows."""
+    columns = [c for c in columns if c in table.colnames]
+    return [{c: _value(row[c]) for c in columns} for row in table[:limit]]
+
+def _query_observations(objectname, obs_collection, instrument_name, dataRights, dataproduct_type, calib_level):
+    from astroquery.mast import Observations
+    return Observations.query_criteria(
+        objectname=objectname,
+        obs_collection=obs_collection.upper(),
+        instrument_name=instrument_name.upper(),
+        dataRights=dataRights.upper(),
+        dataproduct_type=dataproduct_type,
+        calib_level=calib_level
+    )
+
+def _product_list(obsid, extension):
+    key = (str(obsid), extension)
+    if key not in _products:
+        # through mast_request, so concurrent tool calls for one obsid share a lookup
+        from mast_table import mast_table
+        products = mast_table(get_observation_products(obsid))
+        if extension:
+            products = products[[str(name).endswith(extension) for name in products['productFilename']]]
+        _products[key] = products
+    return _products[key]
+
+@mcp.tool()
+async def search_observations(objectname: str, obs_collection: str = 'JWST', instrument_name: str = 'NIRCAM/IMAGE',
+                              dataRights: str = 'PUBLIC', dataproduct_type: str = 'image', calib_level: int = 3,
+                              limit: int = 50, columns: list[str] | None = None) -> dict[str, Any]:
+    """Search MAST for observations of an object.
+
+    Args:
+        objectname: Name of the astronomical object to search for.
+        obs_collection: Name of the observation collection (default is 'JWST').
+        instrument_name: Name of the instrument (default is 'NIRCAM/IMAGE').
+        dataRights: Data rights (default is 'PUBLIC').
+        dataproduct_type: Type of data product to search for (default is 'image').
+        calib_level: Calibration level to filter observations (default is 3).
+        limit: Maximum number of rows to return.
+        columns: Columns to return (default is a compact summary set).
+    """
+    obs_table = await asyncio.to_thread(_query_observations, objectname, obs_collection, instrument_name,
+                                        dataRights, dataproduct_type, calib_level)
+    return {'count': len(obs_table), 'rows': _rows(obs_table, columns or OBS_COLUMNS, limit)}
+
 @mcp.tool()
+async def list_products(obsid: str, extension: str = 'i2d.fits', limit: int = 50,
+                        columns: list[str] | None = None) -> dict[str, Any]:
+    """List the data products of one observation.
+
+    Args:
+        obsid: The obsid of the observation (from search_observations).
+        extension: Only keep products whose filename ends with this (default is 'i2d.fits').
+        limit: Maximum number of rows to return.
+        columns: Columns to return (default is a compact summary set).
+    """
+    products = await asyncio.to_thread(_product_list, obsid, extension)
+    return {'count': len(products), 'rows': _rows(products, columns or PRODUCT_COLUMNS, limit)}
+
+def _download_with_previews(products):
+    from preview import make_preview
+    results = download_products(products, verbose=False)
+    for result in results:
+        result['Preview'] = None
+        if result['Status'] != 'ERROR' and result['Local Path'].endswith('.fits'):
+            try:
+                result['Preview'] = make_preview(result['Local Path'])
+            except Exception as e:
+                result['Message'] = f"{result['Message'] or ''} (no preview: {e})".strip()
+    return results
+
+@mcp.tool()
+async def download(obsid: str, product_filenames: list[str], extension: str = 'i2d.fits') -> dict[str, Any]:
+    """Start a background download of selected products. Poll it with download_status.
+
+    Args:
+        obsid: The obsid the products belong to.
+        product_filenames: productFilename values from list_products.
+        extension: The extension filter used when listing the products.
+    """
+    products = await asyncio.to_thread(_product_list, obsid, extension)
+    wanted = set(product_filenames)
+    selected = products[[name in wanted for name in products['productFilename']]]
+    missing = sorted(wanted - set(selected['productFilename']))
+    job_id = uuid.uuid4().hex[:12]
+    _jobs[job_id] = _job_pool.submit(_download_with_previews, selected)
+    return {'job_id': job_id, 'queued': len(selected), 'not_found': missing}
+
+@mcp.tool()
+def download_status(job_id: str) -> dict[str, Any]:
+    """Report the state of a download job, with per-file results once finished.
+
+    Args:
+        job_id: The id returned by download.
+    """
+    future = _jobs.get(job_id)
+    if future is None:
+        return {'job_id': job_id, 'state': 'unknown'}
+    if not future.done():
+        return {'job_id': job_id, 'state': 'running'}
+    if future.exception() is not None:
+        return {'job_id': job_id, 'state': 'failed', 'error': str(future.exception())}
+    results = [{k: r[k] for k in ('productFilename', 'Local Path', 'Status', 'Message', 'Preview')} for r in future.result()]
+    return {'job_id': job_id, 'state': 'done', 'results': results}
+
+@mcp.tool()
+async def preview(path: str, size: int = 1024, fmt: str = 'png') -> dict[str, Any]:
+    """Return the path of a small preview image of a downloaded FITS file, rendering it if needed.
+
+    Args:
+        path: Local path of the FITS file (the 'Local Path' from download_status).
+        size: Longest side of the preview in pixels.
+        fmt: 'png' or 'jpg'.
+    """
+    from preview import make_preview
+    return {'path': path, 'preview': await asyncio.to_thread(make_preview, path, size, fmt)}
+
 def JWST_search(objectname, obs_collection='JWST', instrument_name='NIRCAM/IMAGE', dataRights='PUBLIC', dataproduct_type='image', calib_level=3):
     """Execute a search for JWST observations and download FITS files.
     
@@ -21,6 +156,12 @@ def JWST_search(objectname, obs_collection='JWST', instrument_name='NIRCAM/IMAGE
         dataproduct_type (str): Type of data product to search for (default is 'image').
         calib_level (int): Calibration level to filter observations (default is 3).
     """
+    from astroquery.mast import Observations
+    from astropy.table import conf
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from preview import make_preview
+
     conf.max_lines = 1000   # or any large number
     conf.max_width = 500    # or any large number
 
@@ -92,36 +233,24 @@ def JWST_search(objectname, obs_collection='JWST', instrument_name='NIRCAM/IMAGE
                         except ValueError:
                             print("Please enter valid numbers separated by commas.")
 
-                    # Download selected products
-                    for dp_index in selected_indices:
+                    # Download selected products in parallel, resuming partial files
+                    print(f"\nDownloading {len(selected_indices)} products...")
+                    download_info = download_products(fits_products[selected_indices])
+                    for dp_index, result in zip(selected_indices, download_info):
                         try:
-                            print(f"\nDownloading product {dp_index + 1} of {len(selected_indices)}...")
-                            download_info = Observations.download_products(fits_products[dp_index:dp_index+1])
-                            fits_file_path = download_info['Local Path'][0]
+                            if result['Status'] == 'ERROR':
+                                raise IOError(result['Message'])
+                            fits_file_path = result['Local Path']
                             print(f"Downloaded file: {fits_file_path}")
 
-                            # Display the image
-                            with fits.open(fits_file_path) as hdul:
-                                hdul.info()
-                                for i, hdu in enumerate(hdul):
-                                    if hdu.data is not None:
-                                        try:
-                                            image_data = hdu.data
-                                            print(f"\nImage shape: {image_data.shape}")
-                                            print(f"Data min/max: {np.nanmin(image_data)}/{np.nanmax(image_data)}")
-                                            plt.figure(figsize=(10, 8))
-                                            plt.imshow(image_data, origin='lower',
-                                                     norm=plt.Normalize(vmin=np.nanpercentile(image_data, 5),
-                                                                         vmax=np.nanpercentile(image_data, 99)),
-                                                     cmap='inferno')
-                                            plt.colorbar(label='Brightness')
-                                            plt.title(f"FITS Image - Product {dp_index}")
-                                            plt.show()
-                                            break
-                                        except Exception as e:
-                                            print(f"Could not display data from extension {i}: {e}")
-                                else:
-                                    print("No image data found in any extension.")
+                            # Display a downsampled preview instead of the full-resolution image
+                            preview_file = make_preview(fits_file_path)
+                            print(f"Preview: {preview_file}")
+                            plt.figure(figsize=(10, 8))
+                            plt.imshow(plt.imread(preview_file))
+                            plt.axis('off')
+                            plt.title(f"FITS Image - Product {dp_index}")
+                            plt.show()
                         except Exception as e:
                             print(f"Error downloading or opening FITS file {dp_index}: {e}")
                             continue
@@ -138,9 +267,10 @@ def JWST_search(objectname, obs_collection='JWST', instrument_name='NIRCAM/IMAGE
     else:
         print("No observations found. Try a different search approach.")
 
-if __name__ == "__main__":
+if __name__ == "__main__" and "--interactive" not in sys.argv:
     # Initialize and run the server
-    # mcp.run(transport='stdio')
+    mcp.run(transport='stdio')
+elif __name__ == "__main__":
     while True:  # Main program loop
         JWST_search(
             # objectname='Horsehead Nebula',  # Example object
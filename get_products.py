@@ -1,28 +1,71 @@
-from mast_request import mast_query
-from utils import json, pp, Table, np
+from mast_request import mast_query_pages
+from utils import logging, ThreadPoolExecutor
 
-def get_observation_products(obsid):
-    product_request = {
+log = logging.getLogger(__name__)
+
+def product_request(obsid, pagesize=100, page=1):
+    return {
         'service': 'Mast.Caom.Products',
         'params': {'obsid': obsid},
         'format': 'json',
-        'pagesize': 100,
-        'page': 1
+        'pagesize': pagesize,
+        'page': page
     }
-    headers, obs_products_string = mast_query(product_request)
-    obs_products = json.loads(obs_products_string)
-    print("Number of data products:", len(obs_products["data"]))
-    pp.pprint(obs_products['fields'])
+
+# bounds on one batched Mast.Caom.Products request
+CHUNK_OBSIDS = 50
+CHUNK_CHARS = 2000
+PRODUCT_PAGESIZE = 2000
+
+def get_observation_products(obsid):
+    obs_products = get_products_batched([obsid])
+    log.debug("fields: %s", obs_products['fields'])
     return obs_products
 
+def obsid_chunks(obsids, max_obsids=CHUNK_OBSIDS, max_chars=CHUNK_CHARS):
+    """Comma-joined obsid lists, each bounded in count and length."""
+    chunk, length = [], 0
+    for obsid in obsids:
+        obsid = str(obsid)
+        if chunk and (len(chunk) >= max_obsids or length + len(obsid) + 1 > max_chars):
+            yield ",".join(chunk)
+            chunk, length = [], 0
+        chunk.append(obsid)
+        length += len(obsid) + 1
+    if chunk:
+        yield ",".join(chunk)
+
+def _chunk_pages(obsid_list, pagesize):
+    return list(mast_query_pages(product_request(obsid_list), pagesize))
+
+def get_products_batched(obsids, pagesize=PRODUCT_PAGESIZE, max_concurrency=4,
+                         max_obsids=CHUNK_OBSIDS, max_chars=CHUNK_CHARS):
+    """Products of many observations in a few batched, fully paged requests.
+
+    Returns one response dict whose rows all carry parent_obsid.
+    """
+    obsids = list(dict.fromkeys(str(o) for o in obsids))
+    chunks = list(obsid_chunks(obsids, max_obsids, max_chars))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks)))) as pool:
+        chunk_pages = list(pool.map(lambda c: _chunk_pages(c, pagesize), chunks))
+    pages = [page for pages in chunk_pages for page in pages]
+    products = {'status': 'COMPLETE', 'fields': [], 'data': []}
+    for page in pages:
+        if not products['fields']:
+            products['fields'] = list(page['fields'])
+        products['data'].extend(page['data'])
+    if not any(f['name'] == 'parent_obsid' for f in products['fields']):
+        products['fields'].append({'name': 'parent_obsid', 'type': 'string'})
+    for row in products['data']:
+        if row.get('parent_obsid') is None:
+            row['parent_obsid'] = row.get('obsID')
+    log.info("Number of data products: %d for %d observations in %d requests",
+             len(products['data']), len(obsids), len(pages))
+    return products
+
 def extract_science_products(obs_products):
+    from mast_table import mast_table  # numpy/astropy load only when a table is built
     sci_prod_arr = [x for x in obs_products['data'] if x.get("productType", None) == 'SCIENCE']
-    science_products = Table()
-    for col, atype in [(x['name'], x['type']) for x in obs_products['fields']]:
-        if atype == "string":
-            atype = "str"
-        if atype == "boolean":
-            atype = "bool"
-        science_products[col] = np.array([x.get(col, None) for x in sci_prod_arr], dtype=atype)
-    print(science_products)
+    science_products = mast_table(obs_products, sci_prod_arr)
+    log.debug("%s", science_products)
     return science_products
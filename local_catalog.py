@@ -0,0 +1,272 @@
+from mast_request import mast_query_pages, set_min_max
+from mast_cone_search import cone_request
+from filtered_query import filtered_request
+from mast_table import mast_table
+from mast_time import mjd_now
+from utils import re, json, sqlite3, threading, logging, np
+from astropy_healpix import HEALPix
+import astropy.units as u
+
+log = logging.getLogger(__name__)
+
+# columns pulled out of the row JSON so they can be indexed
+INDEXED = ('obs_collection', 'instrument_name', 'filters', 'calib_level', 'dataproduct_type')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS fields (name TEXT PRIMARY KEY, type TEXT, position INTEGER);
+CREATE TABLE IF NOT EXISTS observations (
+    obsid TEXT PRIMARY KEY, hpx INTEGER, s_ra REAL, s_dec REAL,
+    {', '.join(f'{c} {"INTEGER" if c == "calib_level" else "TEXT"}' for c in INDEXED)},
+    row TEXT, fp_radius REAL);
+CREATE INDEX IF NOT EXISTS obs_hpx ON observations (hpx);
+{''.join(f'CREATE INDEX IF NOT EXISTS obs_{c} ON observations ({c});' for c in INDEXED)}
+CREATE TABLE IF NOT EXISTS cone_coverage (ra REAL, dec REAL, radius REAL, synced_mjd REAL);
+CREATE TABLE IF NOT EXISTS filter_coverage (filters TEXT PRIMARY KEY, synced_mjd REAL);
+"""
+
+def angular_distance(ra1, dec1, ra2, dec2):
+    """Great-circle distance in degrees (haversine), vectorized over numpy arrays."""
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    a = np.sin((dec2 - dec1) / 2) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+
+# footprints wider than this (degrees) are found by a scan on fp_radius
+# rather than by widening the HEALPix cell set
+WIDE_FOOTPRINT = 1.0
+
+_SHAPES = re.compile(r'(POLYGON|CIRCLE)\s+(?:[A-Z]+\s+)?([-+0-9.eE\s]+)')
+
+def footprint_radius(row):
+    """Radius (degrees) of a circle about s_ra/s_dec enclosing the s_region footprint; 0 if unknown."""
+    ra, dec, region = row.get('s_ra'), row.get('s_dec'), row.get('s_region')
+    if ra is None or dec is None or not region:
+        return 0.0
+    radius = 0.0
+    for shape, numbers in _SHAPES.findall(str(region).upper()):
+        try:
+            values = [float(v) for v in numbers.split()]
+        except ValueError:
+            continue
+        if shape == 'CIRCLE' and len(values) >= 3:
+            radius = max(radius, float(angular_distance(ra, dec, values[0], values[1])) + values[2])
+        elif shape == 'POLYGON' and len(values) >= 6:
+            dist = angular_distance(ra, dec, np.array(values[0::2][:len(values) // 2]), np.array(values[1::2]))
+            radius = max(radius, float(np.max(dist)))
+    return radius
+
+def _canonical(filters):
+    return json.dumps(sorted(filters, key=lambda f: f['paramName']), sort_keys=True)
+
+def _filter_covers(stored, wanted):
+    """True if every row matching wanted also matches stored."""
+    wanted = {f['paramName']: f['values'] for f in wanted}
+    for f in stored:
+        values = wanted.get(f['paramName'])
+        if values is None:
+            return False
+        if f['values'] and isinstance(f['values'][0], dict):
+            lo, hi = f['values'][0]['min'], f['values'][0]['max']
+            if not (values and isinstance(values[0], dict)
+                    and values[0]['min'] >= lo and values[0]['max'] <= hi):
+                return False
+        elif not set(values) <= set(f['values']):
+            return False
+    return True
+
+def row_matches(row, filters):
+    """Evaluate MAST-style filters (value lists or min/max ranges) on one row."""
+    for f in filters:
+        value = row.get(f['paramName'])
+        values = f['values']
+        if not values:
+            continue
+        if isinstance(values[0], dict):
+            if value is None or not values[0]['min'] <= value <= values[0]['max']:
+                return False
+        elif value not in values:
+            return False
+    return True
+
+
+class LocalCatalog:
+    """SQLite store of CAOM observation rows, indexed by HEALPix cell and common filter columns.
+
+    Cone and filtered queries are answered from the local store when an
+    earlier sync fully covers them, and synced from MAST otherwise.
+    """
+
+    def __init__(self, path='mast_catalog.sqlite', nside=64):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        stored = self.db.execute("SELECT value FROM meta WHERE key='nside'").fetchone()
+        if stored is None:
+            self.db.execute("INSERT INTO meta VALUES ('nside', ?)", (str(nside),))
+            self.db.commit()
+        else:
+            nside = int(stored[0])
+        self._migrate()
+        self.healpix = HEALPix(nside=nside, order='nested')
+
+    def _migrate(self):
+        # catalogs written before footprints were tracked lack fp_radius
+        columns = {c[1] for c in self.db.execute("PRAGMA table_info(observations)")}
+        with self.db:
+            if 'fp_radius' in columns:
+                self.db.execute("CREATE INDEX IF NOT EXISTS obs_fp_radius ON observations (fp_radius)")
+                return
+            self.db.execute("ALTER TABLE observations ADD COLUMN fp_radius REAL")
+            self.db.execute("CREATE INDEX IF NOT EXISTS obs_fp_radius ON observations (fp_radius)")
+            self.db.executemany("UPDATE observations SET fp_radius=? WHERE obsid=?",
+                                [(footprint_radius(json.loads(r)), o)
+                                 for o, r in self.db.execute("SELECT obsid, row FROM observations").fetchall()])
+
+    def close(self):
+        self.db.close()
+
+    #----------------  ingest  --------------------
+
+    def add(self, mast_data):
+        """Upsert the rows of one MAST observation response."""
+        rows = [r for r in mast_data['data'] if r.get('obsid') is not None]
+        with self._lock, self.db:
+            known = {name for (name,) in self.db.execute("SELECT name FROM fields")}
+            start = len(known)
+            self.db.executemany("INSERT OR IGNORE INTO fields VALUES (?, ?, ?)",
+                                [(f['name'], f['type'], start + i) for i, f in enumerate(mast_data['fields'])
+                                 if f['name'] not in known])
+            if not rows:
+                return 0
+            ra = np.array([r.get('s_ra') if r.get('s_ra') is not None else np.nan for r in rows], dtype=float)
+            dec = np.array([r.get('s_dec') if r.get('s_dec') is not None else np.nan for r in rows], dtype=float)
+            ok = np.isfinite(ra) & np.isfinite(dec)
+            hpx = np.full(len(rows), -1, dtype=np.int64)
+            hpx[ok] = self.healpix.lonlat_to_healpix(ra[ok] * u.deg, dec[ok] * u.deg)
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO observations (obsid, hpx, s_ra, s_dec, {', '.join(INDEXED)}, row, fp_radius) "
+                f"VALUES (?, ?, ?, ?, {', '.join('?' * len(INDEXED))}, ?, ?)",
+                [(str(r['obsid']), int(h), r.get('s_ra'), r.get('s_dec'),
+                  *[r.get(c) for c in INDEXED], json.dumps(r), footprint_radius(r)) for r, h in zip(rows, hpx)])
+        return len(rows)
+
+    #----------------  sync  --------------------
+
+    def sync_cone(self, ra, dec, radius, since_mjd=None, pagesize=5000):
+        """Pull every observation in a cone into the catalog.
+
+        With since_mjd only observations released after that date are
+        requested (Mast.Caom.Filtered.Position), for incremental refreshes.
+        """
+        if since_mjd is None:
+            request = cone_request(ra, dec, radius)
+        else:
+            request = {
+                'service': 'Mast.Caom.Filtered.Position',
+                'format': 'json',
+                'params': {'columns': '*', 'position': f'{ra}, {dec}, {radius}',
+                           'filters': [{'paramName': 't_obs_release', 'values': set_min_max(since_mjd, 1e6)}]},
+            }
+        synced = mjd_now()
+        n = sum(self.add(page) for page in mast_query_pages(request, pagesize))
+        with self._lock, self.db:
+            self.db.execute("INSERT INTO cone_coverage VALUES (?, ?, ?, ?)", (ra, dec, radius, synced))
+        log.info("synced %d observations within %.3f deg of (%.5f, %.5f)", n, radius, ra, dec)
+        return n
+
+    def sync_filtered(self, filters, since_mjd=None, pagesize=5000):
+        """Pull every observation matching filters into the catalog."""
+        query = list(filters)
+        if since_mjd is not None:
+            query.append({'paramName': 't_obs_release', 'values': set_min_max(since_mjd, 1e6)})
+        synced = mjd_now()
+        n = sum(self.add(page) for page in mast_query_pages(filtered_request(query), pagesize))
+        with self._lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO filter_coverage VALUES (?, ?)", (_canonical(filters), synced))
+        log.info("synced %d observations for %s", n, filters)
+        return n
+
+    def refresh(self):
+        """Incrementally re-sync every covered cone and filter set since its last sync."""
+        n = 0
+        for ra, dec, radius, synced in self.db.execute("SELECT * FROM cone_coverage").fetchall():
+            n += self.sync_cone(ra, dec, radius, since_mjd=synced - 1)
+            with self._lock, self.db:
+                self.db.execute("DELETE FROM cone_coverage WHERE ra=? AND dec=? AND radius=? AND synced_mjd=?",
+                                (ra, dec, radius, synced))
+        for key, synced in self.db.execute("SELECT * FROM filter_coverage").fetchall():
+            n += self.sync_filtered(json.loads(key), since_mjd=synced - 1)
+        return n
+
+    #----------------  coverage  --------------------
+
+    def covers_cone(self, ra, dec, radius, max_age=None):
+        rows = self.db.execute("SELECT ra, dec, radius, synced_mjd FROM cone_coverage").fetchall()
+        if max_age is not None:
+            rows = [r for r in rows if mjd_now() - r[3] <= max_age]
+        if not rows:
+            return False
+        cra, cdec, cradius, _ = np.array(rows).T
+        return bool(np.any(angular_distance(cra, cdec, ra, dec) + radius <= cradius))
+
+    def covers_filters(self, filters, max_age=None):
+        for key, synced in self.db.execute("SELECT * FROM filter_coverage"):
+            if max_age is not None and mjd_now() - synced > max_age:
+                continue
+            if _filter_covers(json.loads(key), filters):
+                return True
+        return False
+
+    #----------------  local queries  --------------------
+
+    def _fields(self):
+        return [{'name': n, 'type': t} for n, t in self.db.execute("SELECT name, type FROM fields ORDER BY position")]
+
+    def _select(self, where, args, filters, extra=''):
+        # push exact-value filters on indexed columns into SQL, evaluate the rest per row
+        for f in filters or []:
+            if f['paramName'] in INDEXED and f['values'] and not isinstance(f['values'][0], dict):
+                where.append(f"{f['paramName']} IN ({', '.join('?' * len(f['values']))})")
+                args.extend(f['values'])
+        sql = f"SELECT row{extra} FROM observations" + (" WHERE " + " AND ".join(where) if where else "")
+        rows = [(json.loads(r), *rest) for (r, *rest) in self.db.execute(sql, args)]
+        if filters:
+            rows = [r for r in rows if row_matches(r[0], filters)]
+        return [r[0] for r in rows] if not extra else rows
+
+    def local_cone_search(self, ra, dec, radius, filters=None):
+        """Observations whose footprint may overlap the cone, from the local store only.
+
+        Like Mast.Caom.Cone this matches on footprint rather than centre: a row
+        is returned when the cone touches the circle around s_ra/s_dec that
+        encloses its s_region, so a few rows near the edge may come back that
+        MAST's exact polygon test would leave out.
+        """
+        cells = self.healpix.cone_search_lonlat(ra * u.deg, dec * u.deg, (radius + WIDE_FOOTPRINT) * u.deg)
+        where = [f"(hpx IN ({', '.join('?' * len(cells))}) OR fp_radius > ?)"]
+        rows = self._select(where, [int(c) for c in cells] + [WIDE_FOOTPRINT], filters, ', fp_radius')
+        if rows:
+            dist = angular_distance(ra, dec, np.array([r['s_ra'] for r, _ in rows], dtype=float),
+                                    np.array([r['s_dec'] for r, _ in rows], dtype=float))
+            rows = [r for (r, fp), d in zip(rows, dist) if d <= radius + (fp or 0.0)]
+        return mast_table({'fields': self._fields(), 'data': rows})
+
+    def local_filtered_query(self, filters):
+        """Observations matching MAST-style filters, from the local store only."""
+        return mast_table({'fields': self._fields(), 'data': self._select([], [], filters)})
+
+    def cone_search(self, ra, dec, radius=0.2, filters=None, max_age=None):
+        """Cone search answered locally, syncing the cone from MAST first if it is not covered.
+
+        Matches on footprint overlap like MAST; see local_cone_search.
+        """
+        if not self.covers_cone(ra, dec, radius, max_age):
+            self.sync_cone(ra, dec, radius)
+        return self.local_cone_search(ra, dec, radius, filters)
+
+    def filtered_query(self, filters, max_age=None):
+        """Filtered query answered locally, syncing from MAST first if it is not covered."""
+        if not self.covers_filters(filters, max_age):
+            self.sync_filtered(filters)
+        return self.local_filtered_query(filters)
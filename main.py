@@ -1,35 +1,32 @@
 from name_resolver import resolve_object
-from mast_cone_search import cone_search
-from get_products import get_observation_products, extract_science_products
-from astroquery.mast import Observations
+from filtered_query import find_observations
+from get_products import get_products_batched, extract_science_products
+from utils import logging
+import metrics
 
 def main():
     object_name = 'NGC 6720'
     ra, dec = resolve_object(object_name)
-    table = cone_search(ra, dec)
 
-    # Create boolean mask for JWST observations
-    jwst_mask = []
-    for i in range(len(table)):
-        if table['obs_collection'][i] == 'JWST':
-            jwst_mask.append(True)
-        else:
-            jwst_mask.append(False)
-
-    # Filter the table to get only JWST observations
-    jwst_observations = table[jwst_mask]
-    
     filter_name = "F150W2"  # Renamed for clarity
+
+    # Only JWST level-3 observations through filter_name come back from MAST;
+    # collection, instrument and calib level are filtered server-side
+    jwst_observations = find_observations(
+        ra, dec, radius=0.2,
+        obs_collection='JWST',
+        calib_level=3,
+        filter_names=[filter_name]
+    )
     
-    # Process each JWST observation
-    for obsid in jwst_observations['obsid']:
-        obs_products = get_observation_products(obsid)
-        science_products = extract_science_products(obs_products)
-        # Download or further process science_products if needed
-        
-        obsid=obsid,
-        product_type='SCIENCE',
-        filter_name=filter_name
-        )
+    # Fetch the products of every JWST observation in a few batched requests
+    all_products = get_products_batched(jwst_observations['obsid'])
+    science_products = extract_science_products(all_products)
+    # Download or further process science_products if needed
+    # (science_products['parent_obsid'] gives each product's observation)
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
     main()
+    if metrics.enabled:
+        print(metrics.summary())
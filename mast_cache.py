@@ -0,0 +1,141 @@
+from utils import re, os, time, gzip, json, hashlib, threading
+
+# seconds a cached response stays fresh, per MAST service
+DEFAULT_TTL = {
+    'Mast.Name.Lookup': 30 * 24 * 3600,
+    'Mast.Caom.Products': 7 * 24 * 3600,
+    'Mast.Caom.Cone': 24 * 3600,
+    'Mast.Caom.Filtered': 3600,
+    'Mast.Caom.Filtered.Position': 3600,
+}
+FALLBACK_TTL = 24 * 3600
+
+# request keys that change how MAST computes a result but not the result itself
+IGNORED_KEYS = ('removecache',)
+
+# bytes at each end of a large body searched for its top-level status
+STATUS_SCAN = 4096
+_STATUS = re.compile(r'"status"\s*:\s*"([A-Z]*)"')
+
+def is_complete(body):
+    """True for a finished MAST response; EXECUTING (partial) and ERROR bodies are not.
+
+    MAST writes status before or after the (possibly huge) data array, so
+    large bodies are not decoded: only their leading and trailing bytes
+    are searched. Small ones, such as name lookups, are parsed whole.
+    """
+    if len(body) > 2 * STATUS_SCAN:
+        match = _STATUS.search(body, 0, STATUS_SCAN) or _STATUS.search(body, len(body) - STATUS_SCAN)
+        return bool(match) and match.group(1) == 'COMPLETE'
+    try:
+        response = json.loads(body)
+    except ValueError:
+        return False
+    if not isinstance(response, dict):
+        return False
+    status = response.get('status')
+    if status == 'COMPLETE':
+        return True
+    # Mast.Name.Lookup leaves status empty and only reports what it resolved
+    return not status and bool(response.get('resolvedCoordinate'))
+
+
+class MastCache:
+    """Gzipped on-disk cache of MAST responses with per-service TTL and LRU eviction.
+
+    Entries are keyed on the canonical JSON of the request. Reads bump the
+    file mtime, so eviction removes the least recently used entries first.
+    """
+
+    def __init__(self, path='.mast_cache', max_bytes=512 * 1024 ** 2, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def key(self, request):
+        canonical = {k: v for k, v in request.items() if k not in IGNORED_KEYS}
+        canonical = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.json.gz')
+
+    def _entries(self):
+        return [e for e in os.scandir(self.path) if e.name.endswith('.json.gz')]
+
+    def get(self, request):
+        """Return cached (headers, body) for request, or None."""
+        file = self._file(self.key(request))
+        try:
+            with gzip.open(file, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        ttl = self.ttl.get(request.get('service'), FALLBACK_TTL)
+        if time.time() - entry['time'] > ttl:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            # evicted since it was read
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry['headers'], entry['body']
+
+    def put(self, request, headers, body):
+        """Store a response; incomplete ones are skipped. Returns whether it was stored."""
+        if not is_complete(body):
+            return False
+        file = self._file(self.key(request))
+        entry = {'time': time.time(), 'service': request.get('service'),
+                 'headers': dict(headers), 'body': body}
+        tmp = f"{file}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f)
+        old = os.path.getsize(file) if os.path.exists(file) else 0
+        os.replace(tmp, file)
+        with self._lock:
+            self._size += os.path.getsize(file) - old
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return True
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes."""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+            self._size = sum(e.stat().st_size for e in entries)
+            for entry in entries:
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                self._size -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries():
+                os.remove(entry.path)
+            self._size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries()), 'bytes': self._size}
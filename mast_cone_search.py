@@ -1,8 +1,11 @@
-from mast_request import mast_query
-from utils import json, pp, Table, np
+from mast_request import mast_query_stream, mast_query_pages
+from mast_table import mast_table, columns_table
+from utils import logging
 
-def cone_search(ra, dec, radius=0.2, pagesize=2000, page=1):
-    mast_request = {
+log = logging.getLogger(__name__)
+
+def cone_request(ra, dec, radius=0.2, pagesize=2000, page=1):
+    return {
         'service': 'Mast.Caom.Cone',
         'params': {'ra': ra, 'dec': dec, 'radius': radius},
         'format': 'json',
@@ -11,16 +14,16 @@ def cone_search(ra, dec, radius=0.2, pagesize=2000, page=1):
         'removenullcolumns': True,
         'removecache': True
     }
-    headers, mast_data_str = mast_query(mast_request)
-    mast_data = json.loads(mast_data_str)
-    print("Query status:", mast_data['status'])
-    pp.pprint(mast_data['fields'][:5])
-    table = Table()
-    for col, atype in [(x['name'], x['type']) for x in mast_data['fields']]:
-        if atype == "string":
-            atype = "str"
-        if atype == "boolean":
-            atype = "bool"
-        table[col] = np.array([x.get(col, None) for x in mast_data['data']], dtype=atype)
-    print(table)
+
+def cone_search(ra, dec, radius=0.2, pagesize=2000, page=1):
+    mast_data = mast_query_stream(cone_request(ra, dec, radius, pagesize, page), columns=True)
+    log.info("Query status: %s", mast_data['status'])
+    log.debug("fields: %s", mast_data['fields'][:5])
+    table = columns_table(mast_data)
+    log.debug("%s", table)
     return table
+
+def cone_search_pages(ra, dec, radius=0.2, pagesize=2000, prefetch=True):
+    """Yield the full cone search result as one Table per page."""
+    for mast_data in mast_query_pages(cone_request(ra, dec, radius), pagesize, prefetch):
+        yield mast_table(mast_data)
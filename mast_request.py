@@ -1,18 +1,274 @@
-from utils import sys, json, requests, urlencode
+from mast_cache import MastCache
+from mast_stream import parse_response, RowSink, ColumnSink
+from mast_scheduler import SingleFlight, TokenBucket, THROTTLE_STATUS, request_key, retry_after
+from metrics import span
+from utils import sys, json, requests, urlencode, HTTPAdapter, Retry, asyncio, ThreadPoolExecutor
+
+MAST_URL = 'https://mast.stsci.edu/api/v0/invoke'
+VERSION = ".".join(map(str, sys.version_info[:3]))
+HEADERS = {
+    "Content-type": "application/x-www-form-urlencoded",
+    "Accept": "text/plain",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "User-agent": f"python-requests/{VERSION}"
+}
+
+# (connect, read) timeout in seconds
+TIMEOUT = (10, 300)
+
+# server errors retried with exponential backoff
+RETRY_STATUS = (500, 502, 504)
+
+_session = None
+_cache = None
+_flights = SingleFlight()
+_limiter = TokenBucket()
+
+# attempts at a throttled (429/503) request, and the wait when no Retry-After is given
+THROTTLE_RETRIES = 5
+THROTTLE_BACKOFF = 1.0
+
+def configure_session(pool_size=10, retries=3, backoff=0.5, timeout=None):
+    """Build the shared keep-alive session used by mast_query."""
+    global _session, TIMEOUT
+    if timeout is not None:
+        TIMEOUT = timeout
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS,
+        respect_retry_after_header=False,  # 429/503 go through the rate limiter instead
+        allowed_methods=None,  # MAST invoke is a POST; retry it too
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if _session is not None:
+        _session.close()
+    _session = session
+    return session
+
+def get_session():
+    """Return the shared session, creating it on first use."""
+    if _session is None:
+        configure_session()
+    return _session
+
+def configure_limiter(rate=10.0, burst=20, min_rate=0.2, max_rate=50.0, **kwargs):
+    """Replace the shared rate limiter (requests/s adapt between min_rate and max_rate)."""
+    global _limiter
+    _limiter = TokenBucket(rate, burst, min_rate, max_rate, **kwargs)
+    return _limiter
+
+def get_limiter():
+    return _limiter
+
+def enable_cache(path='.mast_cache', max_bytes=512 * 1024 ** 2, ttl=None):
+    """Serve repeated requests from an on-disk MastCache. Returns the cache."""
+    global _cache
+    _cache = MastCache(path, max_bytes, ttl)
+    return _cache
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+def _cached(request):
+    if _cache is None:
+        return None
+    hit = _cache.get(request)
+    if hit is None:
+        return None
+    headers, body = hit
+    return requests.structures.CaseInsensitiveDict(headers), body
+
+def _post(request, stream=False):
+    # POST through the rate limiter, waiting out 429/503 responses
+    data = "request=" + urlencode(json.dumps(request))
+    for attempt in range(THROTTLE_RETRIES + 1):
+        _limiter.acquire()
+        resp = get_session().post(MAST_URL, data=data, timeout=TIMEOUT, stream=stream)
+        if resp.status_code not in THROTTLE_STATUS or attempt == THROTTLE_RETRIES:
+            if resp.ok:
+                _limiter.succeeded()
+            return resp
+        _limiter.throttled(retry_after(resp.headers, THROTTLE_BACKOFF * 2 ** attempt))
+        resp.close()
 
 def mast_query(request):
-    """Perform a MAST query."""
-    request_url = 'https://mast.stsci.edu/api/v0/invoke'
-    version = ".".join(map(str, sys.version_info[:3]))
-    headers = {
-        "Content-type": "application/x-www-form-urlencoded",
-        "Accept": "text/plain",
-        "User-agent": f"python-requests/{version}"
-    }
-    req_string = json.dumps(request)
-    req_string = urlencode(req_string)
-    resp = requests.post(request_url, data="request=" + req_string, headers=headers)
-    return resp.headers, resp.content.decode('utf-8')
+    """Perform a MAST query.
+
+    Identical requests made while one is already in flight wait for it and
+    share its result instead of going to the network again.
+    """
+    return _flights.do(('text', request_key(request)), lambda: _mast_query(request))
+
+def _mast_query(request):
+    with span('mast_query', service=request.get('service')) as sp:
+        hit = _cached(request)
+        if hit is not None:
+            sp.set(status='cached')
+            return hit
+        resp = _post(request)
+        sp.set(status=resp.status_code)
+        sp.add('bytes', len(resp.content))
+        body = resp.content.decode('utf-8')
+        if _cache is not None and resp.ok:
+            _cache.put(request, resp.headers, body)
+        return resp.headers, body
+
+def decode_response(body, service=None):
+    """json.loads a MAST response body, timed as a json_decode span."""
+    with span('json_decode', service=service):
+        return json.loads(body)
+
+STREAM_CHUNK = 256 * 1024
+
+def mast_query_stream(request, columns=False, chunk_size=STREAM_CHUNK):
+    """Perform a MAST query and decode the response while it downloads.
+
+    Rows go straight from the socket into a list of dicts, or with
+    columns=True into per-column lists ('columns' and 'nrows' replace 'data';
+    see mast_table.columns_table). The body is never held as one string.
+    Concurrent identical requests share one download; each caller gets its
+    own top-level dict and lists, but the row dicts themselves are shared.
+    """
+    key = ('columns' if columns else 'rows', request_key(request))
+    response = _flights.do(key, lambda: _mast_query_stream(request, columns, chunk_size))
+    response = dict(response)
+    if columns:
+        response['columns'] = {name: list(values) for name, values in response['columns'].items()}
+    else:
+        response['data'] = list(response['data'])
+    return response
+
+def _mast_query_stream(request, columns, chunk_size):
+    service = request.get('service')
+    sink = ColumnSink() if columns else RowSink()
+    if _cache is not None:
+        # the cache stores whole bodies, so take the buffered path
+        headers, body = _mast_query(request)
+        with span('json_decode', service=service):
+            return parse_response([body.encode('utf-8')], sink)
+    with span('mast_query', service=service) as sp:
+        with _post(request, stream=True) as resp:
+            sp.set(status=resp.status_code)
+            resp.raise_for_status()
+
+            def chunks():
+                for chunk in resp.iter_content(chunk_size):
+                    sp.add('bytes', len(chunk))
+                    yield chunk
+
+            with span('json_decode', service=service, mode='stream'):
+                return parse_response(chunks(), sink)
+
+def mast_query_pages(request, pagesize=2000, prefetch=True):
+    """Yield decoded MAST responses page by page.
+
+    The row count reported with the first page decides how many pages are
+    fetched. With prefetch, the next page is requested while the caller is
+    still working on the current one.
+    """
+    def fetch(page):
+        paged = dict(request, pagesize=pagesize, page=page)
+        if page > 1 and 'removecache' in paged:
+            paged['removecache'] = False  # reuse the server-side result set
+        return mast_query_stream(paged)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        page = 1
+        data = fetch(page)
+        paging = data.get('paging') or {}
+        total = paging.get('rowsFiltered', paging.get('rowsTotal', len(data['data'])))
+        npages = max(1, -(-total // pagesize))
+        while True:
+            pending = None
+            if prefetch and page < npages:
+                pending = pool.submit(fetch, page + 1)
+            yield data
+            if page >= npages or len(data['data']) < pagesize:
+                if pending:
+                    pending.cancel()
+                break
+            page += 1
+            data = pending.result() if pending else fetch(page)
+
+def async_client(max_concurrency=10, timeout=None):
+    """Build an httpx.AsyncClient sized for max_concurrency connections."""
+    from utils import httpx
+    connect, read = timeout or TIMEOUT
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    return httpx.AsyncClient(
+        headers=HEADERS,
+        limits=limits,
+        timeout=httpx.Timeout(read, connect=connect),
+        transport=httpx.AsyncHTTPTransport(retries=3, limits=limits)
+    )
+
+async def amast_query(request, client=None, retries=3, backoff=0.5):
+    """Perform a MAST query asynchronously.
+
+    Identical requests in flight on the same event loop share one call.
+    """
+    if client is None:
+        async with async_client() as client:
+            return await amast_query(request, client, retries, backoff)
+    return await _flights.ado(('text', request_key(request)),
+                              lambda: _amast_query(request, client, retries, backoff))
+
+async def _amast_query(request, client, retries, backoff):
+    from utils import httpx
+    with span('mast_query', service=request.get('service')) as sp:
+        hit = _cached(request)
+        if hit is not None:
+            sp.set(status='cached')
+            return hit
+        req_string = urlencode(json.dumps(request))
+        for attempt in range(retries + 1):
+            await _limiter.aacquire()
+            try:
+                resp = await client.post(MAST_URL, content="request=" + req_string)
+                if resp.status_code in THROTTLE_STATUS and attempt < retries:
+                    _limiter.throttled(retry_after(resp.headers, backoff * 2 ** attempt))
+                    continue
+                if resp.status_code not in RETRY_STATUS or attempt == retries:
+                    sp.set(status=resp.status_code)
+                    sp.add('bytes', len(resp.content))
+                    body = resp.content.decode('utf-8')
+                    if resp.is_success:
+                        _limiter.succeeded()
+                        if _cache is not None:
+                            _cache.put(request, resp.headers, body)
+                    return resp.headers, body
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+async def amast_query_many(requests, max_concurrency=10):
+    """Run many MAST queries concurrently.
+
+    Results come back in input order. Each entry is a (headers, body) tuple,
+    or the exception raised by that request.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async with async_client(max_concurrency) as client:
+        async def run(request):
+            async with semaphore:
+                return await amast_query(request, client)
+        return await asyncio.gather(*(run(r) for r in requests), return_exceptions=True)
+
+def mast_query_many(requests, max_concurrency=10):
+    """Blocking wrapper around amast_query_many."""
+    return asyncio.run(amast_query_many(requests, max_concurrency))
 
 def set_filters(parameters):
     return [{"paramName": p, "values": v} for p, v in parameters.items()]
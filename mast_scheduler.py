@@ -0,0 +1,155 @@
+from mast_cache import IGNORED_KEYS
+from metrics import count
+from utils import time, json, threading, asyncio, logging, Future, parsedate_to_datetime
+
+log = logging.getLogger(__name__)
+
+# statuses that mean "slow down" rather than "failed"
+THROTTLE_STATUS = (429, 503)
+
+def request_key(request):
+    """Canonical JSON of a request, ignoring keys that don't change the result."""
+    canonical = {k: v for k, v in request.items() if k not in IGNORED_KEYS}
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+
+def retry_after(headers, default=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    value = headers.get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate adapts to server throttling.
+
+    Every request takes a token. A throttled response cuts the rate by
+    `decrease` (at most once per `cooldown` seconds) and, given a Retry-After,
+    holds all callers until then; each success adds `increase` requests/s
+    back, up to max_rate.
+    """
+
+    def __init__(self, rate=10.0, burst=20, min_rate=0.2, max_rate=50.0,
+                 increase=0.5, decrease=0.5, cooldown=1.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.throttles = 0
+        self.waited = 0.0
+        self._last_decrease = float('-inf')
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # take a token now, going into debt if needed, and return the wait for it;
+        # `updated` may lie in the future while a Retry-After hold is active
+        with self._lock:
+            now = time.monotonic()
+            if now > self.updated:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+            self.tokens -= 1
+            wait = self.updated - now
+            if self.tokens < 0:
+                wait += -self.tokens / self.rate
+            self.waited += wait
+            return wait
+
+    def acquire(self):
+        """Block until a request may be sent. Returns the time waited."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def throttled(self, delay=None):
+        """Record a 429/503: slow down, and pause everyone for delay seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            if now - self._last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._last_decrease = now
+            self.tokens = min(self.tokens, 0.0)
+            if delay:
+                self.updated = max(self.updated, now + delay)
+        count('mast_throttled')
+        log.warning("MAST throttled the client; rate now %.2f req/s, holding %.1fs", self.rate, delay or 0)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def stats(self):
+        with self._lock:
+            return {'rate': self.rate, 'tokens': self.tokens, 'throttles': self.throttles, 'waited': self.waited}
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one.
+
+    The first caller runs the work; callers arriving while it is in flight
+    wait and get the same result (or exception). Nothing is kept afterwards.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            count('mast_coalesced')
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key, coro_fn):
+        """Async version of do, coalescing per event loop."""
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = loop.create_task(coro_fn())
+                task.add_done_callback(lambda t: self._tasks.pop(task_key, None))
+            else:
+                self.shared += 1
+                count('mast_coalesced')
+        # one waiter being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
@@ -0,0 +1,141 @@
+from utils import json, codecs
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class RowSink:
+    """Collects streamed rows as a list of dicts (the shape json.loads gives)."""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def finish(self, response):
+        response['data'] = self.rows
+        return response
+
+
+class ColumnSink:
+    """Appends each streamed row straight into per-column lists.
+
+    The finished response has 'columns' (name -> values) and 'nrows' instead
+    of 'data'; rows missing a key get None in that column.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.nrows = 0
+
+    def add(self, row):
+        n = self.nrows
+        columns = self.columns
+        for key, value in row.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * n
+            column.append(value)
+        self.nrows = n + 1
+        if len(row) != len(columns):
+            for column in columns.values():
+                if len(column) == n:
+                    column.append(None)
+
+    def finish(self, response):
+        response['columns'] = self.columns
+        response['nrows'] = self.nrows
+        return response
+
+
+class _Reader:
+    # rolling text buffer over an iterable of byte chunks
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            text = self.utf8.decode(b'', final=True)
+        else:
+            text = self.utf8.decode(chunk)
+        # drop what has already been parsed before growing the buffer
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # next non-whitespace character, without consuming it
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.fill():
+                raise ValueError("unexpected end of MAST response")
+
+    def expect(self, chars):
+        ch = self.peek()
+        if ch not in chars:
+            raise ValueError(f"malformed MAST response: expected {chars!r}, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        # one complete JSON value; a value that ends exactly at the buffer end
+        # (e.g. a number) may continue in the next chunk, so read on first
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def parse_response(chunks, sink=None):
+    """Decode a MAST JSON response from byte chunks, streaming 'data' rows into sink.
+
+    Every other top-level key (status, fields, paging, ...) is decoded
+    normally; rows are handed to sink one at a time as they arrive.
+    """
+    sink = RowSink() if sink is None else sink
+    reader = _Reader(chunks)
+    response = {}
+    reader.expect('{')
+    if reader.peek() == '}':
+        return sink.finish(response)
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'data' and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() != ']':
+                while True:
+                    sink.add(reader.value())
+                    if reader.expect(',]') == ']':
+                        break
+            else:
+                reader.expect(']')
+        else:
+            response[key] = reader.value()
+        if reader.expect(',}') == '}':
+            break
+    return sink.finish(response)
@@ -0,0 +1,78 @@
+from metrics import span
+from utils import np, Table, MaskedColumn, itemgetter
+
+# MAST field types -> numpy dtypes, plus the fill used under masked nulls
+MAST_DTYPES = {
+    'string': ('str', ''),
+    'char': ('str', ''),
+    'boolean': ('bool', False),
+    'byte': ('int8', 0),
+    'short': ('int16', 0),
+    'int': ('int64', 0),
+    'long': ('int64', 0),
+    'float': ('float64', np.nan),
+    'double': ('float64', np.nan),
+    'date': ('datetime64[ms]', 'NaT'),
+}
+
+def _column(name, values, atype):
+    dtype, fill = MAST_DTYPES.get(atype, ('object', None))
+    mask = [v is None for v in values]
+    if any(mask):
+        values = [fill if m else v for v, m in zip(values, mask)]
+    try:
+        array = np.array(values, dtype=dtype)
+    except OverflowError:
+        # a narrow integer type holding a value it cannot represent
+        array = np.array(values, dtype='int64')
+    except (ValueError, TypeError):
+        # e.g. a date column in an unexpected format
+        array = np.array(values, dtype='str')
+    if any(mask):
+        return MaskedColumn(array, name=name, mask=mask)
+    return array
+
+def mast_table(mast_data, rows=None):
+    """Convert a MAST JSON response into an astropy Table.
+
+    All columns are built from one pass over the rows; nulls become masked
+    entries. rows can be given to convert a subset of mast_data['data'].
+    """
+    rows = mast_data['data'] if rows is None else rows
+    with span('table_conversion') as sp:
+        sp.add('rows', len(rows))
+        return _mast_table(mast_data['fields'], rows)
+
+def columns_table(mast_data):
+    """Convert a column-streamed MAST response (see mast_stream.ColumnSink) into a Table."""
+    with span('table_conversion') as sp:
+        nrows = mast_data['nrows']
+        sp.add('rows', nrows)
+        columns = mast_data['columns']
+        fields = [(x['name'], x['type']) for x in mast_data['fields']]
+        return _build_table(fields, [columns.get(name, [None] * nrows) for name, atype in fields], nrows)
+
+def _mast_table(fields, rows):
+    fields = [(x['name'], x['type']) for x in fields]
+    names = [name for name, atype in fields]
+    if not rows:
+        return _build_table(fields, [], 0)
+    try:
+        if len(names) == 1:
+            columns = [list(map(itemgetter(names[0]), rows))]
+        else:
+            columns = list(zip(*map(itemgetter(*names), rows)))
+    except KeyError:
+        # some rows omit keys; fall back to .get for the whole batch
+        columns = list(zip(*[[row.get(n) for n in names] for row in rows]))
+    return _build_table(fields, columns, len(rows))
+
+def _build_table(fields, columns, nrows):
+    table = Table()
+    if not nrows:
+        for name, atype in fields:
+            table[name] = np.array([], dtype=MAST_DTYPES.get(atype, ('object',))[0])
+        return table
+    for (name, atype), values in zip(fields, columns):
+        table[name] = _column(name, list(values), atype)
+    return table
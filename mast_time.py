@@ -0,0 +1,5 @@
+import time
+
+def mjd_now():
+    # current time as a Modified Julian Date, the unit of MAST's t_obs_release
+    return time.time() / 86400.0 + 40587.0
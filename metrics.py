@@ -0,0 +1,151 @@
+"""Lightweight timing and counter instrumentation.
+
+Disabled by default, in which case span() hands back a shared no-op
+context manager and count() returns immediately. Enable with
+metrics.enable() or MAST_METRICS=1 in the environment, then export with
+summary(), to_jsonl() or to_prometheus().
+"""
+import os
+import time
+import json
+import threading
+from collections import deque
+
+enabled = os.environ.get('MAST_METRICS', '') not in ('', '0')
+
+_lock = threading.Lock()
+_spans = {}      # (name, labels) -> [count, total, min, max]
+_counters = {}   # (name, labels) -> value
+# the most recent finished spans, one dict each, for JSON lines export;
+# bounded so a long-running server with metrics on does not grow forever
+MAX_EVENTS = int(os.environ.get('MAST_METRICS_EVENTS', 100_000))
+_events = deque(maxlen=MAX_EVENTS)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **labels):
+        pass
+
+    def add(self, name, value=1):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.counts = {}
+
+    def set(self, **labels):
+        """Attach labels known only once the work is done (e.g. status)."""
+        self.labels.update(labels)
+
+    def add(self, name, value=1):
+        """Add to a counter that is recorded with this span's labels."""
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.labels['error'] = exc_type.__name__
+        key = (self.name, tuple(sorted((k, str(v)) for k, v in self.labels.items())))
+        with _lock:
+            stats = _spans.get(key)
+            if stats is None:
+                _spans[key] = [1, elapsed, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = min(stats[2], elapsed)
+                stats[3] = max(stats[3], elapsed)
+            for name, value in self.counts.items():
+                ckey = (f'{self.name}_{name}', key[1])
+                _counters[ckey] = _counters.get(ckey, 0) + value
+            _events.append({'span': self.name, 'seconds': elapsed, 'time': time.time(),
+                            **self.labels, **self.counts})
+        return False
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _events.clear()
+
+def span(name, **labels):
+    """Time a block: `with span('mast_query', service=s) as sp: ...`."""
+    if not enabled:
+        return _NO_SPAN
+    return _Span(name, labels)
+
+def count(name, value=1, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def _label_str(labels):
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+def summary():
+    """Per-span count/total/mean/min/max and counters as a text table."""
+    lines = [f"{'span':56s} {'count':>7s} {'total s':>10s} {'mean s':>10s} {'min s':>10s} {'max s':>10s}"]
+    with _lock:
+        for (name, labels), (n, total, lo, hi) in sorted(_spans.items()):
+            label = f"{name}{{{_label_str(labels)}}}" if labels else name
+            lines.append(f"{label:56s} {n:7d} {total:10.4f} {total / n:10.4f} {lo:10.4f} {hi:10.4f}")
+        if _counters:
+            lines.append("")
+            lines.append(f"{'counter':56s} {'value':>12s}")
+            for (name, labels), value in sorted(_counters.items()):
+                label = f"{name}{{{_label_str(labels)}}}" if labels else name
+                lines.append(f"{label:56s} {value:>12}")
+    return "\n".join(lines)
+
+def to_jsonl(path):
+    """Write the recorded spans (the last MAX_EVENTS) as one JSON object per line."""
+    with _lock:
+        events = list(_events)
+    with open(path, 'w') as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+def to_prometheus(prefix=None):
+    """Spans as <span>_seconds summaries, counters as <name>_total (optionally prefixed)."""
+    def fmt(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+    lines = []
+    with _lock:
+        for name in sorted({n for n, _ in _spans}):
+            metric = f"{prefix}_{name}_seconds" if prefix else f"{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for (n, labels), (c, total, lo, hi) in sorted(_spans.items()):
+                if n == name:
+                    lines.append(f"{metric}_count{fmt(labels)} {c}")
+                    lines.append(f"{metric}_sum{fmt(labels)} {total}")
+        for name in sorted({n for n, _ in _counters}):
+            metric = f"{prefix}_{name}_total" if prefix else f"{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (n, labels), value in sorted(_counters.items()):
+                if n == name:
+                    lines.append(f"{metric}{fmt(labels)} {value}")
+    return "\n".join(lines) + "\n"
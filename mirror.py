@@ -0,0 +1,249 @@
+"""Incremental mirror of the science products of a set of targets.
+
+    python mirror.py "NGC 6720" "83.822,-5.391,0.1" --filters F150W2 F444W
+
+Each run asks MAST only for observations released since the previous run
+of the same target and filters, looks up their products in batches and
+downloads the new or changed ones in parallel. A SQLite manifest in the
+download directory records what was fetched (obsid, productFilename,
+size, checksum), so files already mirrored are neither queried nor
+downloaded again.
+"""
+from name_resolver import resolve_object
+from filtered_query import find_observations, filter_name_match
+from get_products import get_products_batched
+from download_manager import DOWNLOAD_DIR, download_products
+from mast_time import mjd_now
+from utils import os, sys, time, json, sqlite3, threading, logging
+import argparse
+import metrics
+
+log = logging.getLogger(__name__)
+
+MANIFEST = 'mirror_manifest.sqlite'
+# days re-queried before the last sync, for rows MAST published late
+OVERLAP_DAYS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS syncs (key TEXT PRIMARY KEY, synced_mjd REAL);
+CREATE TABLE IF NOT EXISTS observations (key TEXT, obsid TEXT, PRIMARY KEY (key, obsid));
+CREATE TABLE IF NOT EXISTS products (
+    productFilename TEXT PRIMARY KEY, obsid TEXT, dataURI TEXT, size INTEGER,
+    checksum TEXT, local_path TEXT, fetched REAL);
+"""
+
+def parse_target(target, radius=0.2):
+    """'NGC 6720' (resolved by name) or 'ra,dec[,radius]' in degrees -> (ra, dec, radius)."""
+    parts = [p.strip() for p in str(target).split(',')]
+    try:
+        numbers = [float(p) for p in parts]
+    except ValueError:
+        ra, dec = resolve_object(target)
+        return float(ra), float(dec), radius
+    if len(numbers) not in (2, 3):
+        raise ValueError(f"region must be 'ra,dec' or 'ra,dec,radius', got {target!r}")
+    return numbers[0], numbers[1], numbers[2] if len(numbers) == 3 else radius
+
+def product_matches(row, extension=None, calib_level=None, filter_names=None, product_type='SCIENCE',
+                    data_rights=None):
+    """Product-level filters on one product row."""
+    if product_type and row.get('productType') != product_type:
+        return False
+    if data_rights and str(row.get('dataRights', '')).upper() != data_rights.upper():
+        return False
+    if extension and not str(row.get('productFilename', '')).endswith(extension):
+        return False
+    if calib_level is not None:
+        lo, hi = calib_level if isinstance(calib_level, (tuple, list)) else (calib_level, calib_level)
+        if row.get('calib_level') is not None and not lo <= row['calib_level'] <= hi:
+            return False
+    if filter_names and row.get('filters') is not None:
+        if not filter_name_match(row['filters'], filter_names):
+            return False
+    return True
+
+
+class Manifest:
+    """SQLite record of synced targets, their observations and the products fetched."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def last_sync(self, key):
+        row = self.db.execute("SELECT synced_mjd FROM syncs WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def mark_synced(self, key, mjd, obsids):
+        # mjd None records the obsids but keeps the previous sync time
+        with self._lock, self.db:
+            if mjd is not None:
+                self.db.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?)", (key, mjd))
+            self.db.executemany("INSERT OR IGNORE INTO observations VALUES (?, ?)",
+                                [(key, str(o)) for o in obsids])
+
+    def known_obsids(self, key):
+        return {o for (o,) in self.db.execute("SELECT obsid FROM observations WHERE key=?", (key,))}
+
+    def product(self, filename):
+        row = self.db.execute("SELECT obsid, dataURI, size, checksum, local_path FROM products "
+                              "WHERE productFilename=?", (filename,)).fetchone()
+        return dict(zip(('obsid', 'dataURI', 'size', 'checksum', 'local_path'), row)) if row else None
+
+    def record(self, product, path, checksum):
+        with self._lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (str(product['productFilename']), _obsid(product),
+                             str(product['dataURI']), _size(product), checksum, path, time.time()))
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+
+def _obsid(product):
+    return str(product.get('parent_obsid') or product.get('obsID'))
+
+def _size(product):
+    try:
+        return int(product['size'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _checksum(product):
+    for name in ('md5', 'checksum'):
+        if product.get(name):
+            return str(product[name]).lower()
+    return None
+
+def is_current(product, entry):
+    """True if the manifest entry still describes this product and its file is on disk."""
+    if entry is None or entry['dataURI'] != str(product['dataURI']):
+        return False
+    size, checksum = _size(product), _checksum(product)
+    if size is not None and entry['size'] != size:
+        return False
+    if checksum is not None and entry['checksum'] not in (None, checksum):
+        return False
+    path = entry['local_path']
+    return bool(path) and os.path.exists(path) and (entry['size'] is None or os.path.getsize(path) == entry['size'])
+
+def sync_target(manifest, target, obs_collection='JWST', instrument_name=None, calib_level=3,
+                filter_names=None, extension='_i2d.fits', radius=0.2, data_rights='PUBLIC', full=False):
+    """Find the products of one target that are missing or changed locally.
+
+    Only observations released since the last sync of the same target and
+    filters are queried, unless full is set or this is the first sync.
+    data_rights ('PUBLIC' by default, None for any) is pushed down to MAST
+    and checked again on each product.
+    Returns (sync key, observation obsids, products to download).
+    """
+    ra, dec, radius = parse_target(target, radius)
+    key = json.dumps({'ra': round(ra, 6), 'dec': round(dec, 6), 'radius': radius,
+                      'obs_collection': obs_collection, 'instrument_name': instrument_name,
+                      'calib_level': calib_level, 'filter_names': sorted(filter_names or []),
+                      'extension': extension, 'data_rights': data_rights}, sort_keys=True)
+    last = None if full else manifest.last_sync(key)
+    released_after = None if last is None else last - OVERLAP_DAYS
+    observations = find_observations(ra, dec, radius, obs_collection=obs_collection,
+                                     instrument_name=instrument_name, calib_level=calib_level,
+                                     filter_names=filter_names, columns='obsid,filters',
+                                     released_after=released_after, data_rights=data_rights)
+    obsids = [str(o) for o in observations['obsid']] if len(observations) else []
+    if not full:
+        known = manifest.known_obsids(key)
+        obsids = [o for o in obsids if o not in known]
+    log.info("%s: %d observations to check%s", target, len(obsids),
+             "" if released_after is None else f" (released after MJD {released_after:.1f})")
+    if not obsids:
+        return key, obsids, []
+    products = get_products_batched(obsids)['data']
+    wanted = [p for p in products if product_matches(p, extension, calib_level, filter_names,
+                                                     data_rights=data_rights)]
+    stale = [p for p in wanted if not is_current(p, manifest.product(str(p['productFilename'])))]
+    return key, obsids, stale
+
+def sync(targets, download_dir=DOWNLOAD_DIR, manifest_path=None, max_workers=4, dry_run=False, **filters):
+    """Bring the local mirror of targets up to date. Returns a summary dict.
+
+    filters are passed to sync_target (obs_collection, instrument_name,
+    calib_level, filter_names, extension, radius, data_rights, full).
+    Each target's sync state is recorded on its own: a target whose
+    downloads all succeeded moves its sync time forward, one with failures
+    keeps its old sync time and leaves out the obsids of the failed
+    products, so the next run asks for just those again.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    manifest = Manifest(manifest_path or os.path.join(download_dir, MANIFEST))
+    summary = {'targets': len(targets), 'observations': 0, 'queued': 0,
+               'downloaded': 0, 'skipped': 0, 'errors': 0, 'bytes': 0}
+    try:
+        synced = mjd_now()
+        pending, checked = {}, []
+        for target in targets:
+            key, obsids, stale = sync_target(manifest, target, **filters)
+            checked.append((key, obsids, stale))
+            summary['observations'] += len(obsids)
+            for product in stale:
+                pending.setdefault(str(product['productFilename']), product)
+        products = list(pending.values())
+        summary['queued'] = len(products)
+        if dry_run:
+            summary['products'] = [p['productFilename'] for p in products]
+            return summary
+        results = download_products(products, download_dir, max_workers, verbose=False) if products else []
+        failed = set()
+        for product, result in zip(products, results):
+            summary['bytes'] += result['bytes']
+            if result['Status'] == 'ERROR':
+                summary['errors'] += 1
+                failed.add(str(product['productFilename']))
+                log.warning("%s: %s", result['productFilename'], result['Message'])
+                continue
+            summary['downloaded' if result['Status'] == 'COMPLETE' else 'skipped'] += 1
+            path = result['Local Path']
+            manifest.record(product, path, _checksum(product) or result['digest'])
+        for key, obsids, stale in checked:
+            retry = {_obsid(p) for p in stale if str(p['productFilename']) in failed}
+            manifest.mark_synced(key, None if retry else synced, [o for o in obsids if o not in retry])
+        summary['manifest_products'] = manifest.count()
+        return summary
+    finally:
+        manifest.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally mirror the science products of MAST targets.")
+    parser.add_argument('targets', nargs='+', help="object names, or regions as 'ra,dec[,radius]' in degrees")
+    parser.add_argument('--dir', default=DOWNLOAD_DIR, help="download directory (holds the manifest)")
+    parser.add_argument('--manifest', help="manifest path (default <dir>/%s)" % MANIFEST)
+    parser.add_argument('--collection', default='JWST')
+    parser.add_argument('--instrument')
+    parser.add_argument('--calib-level', type=int, default=3)
+    parser.add_argument('--filters', nargs='*', help="filter names, e.g. F150W2 F444W")
+    parser.add_argument('--extension', default='_i2d.fits', help="product filename suffix ('' for all)")
+    parser.add_argument('--radius', type=float, default=0.2, help="cone radius for named targets, degrees")
+    parser.add_argument('--data-rights', default='PUBLIC', help="dataRights to mirror ('' for any)")
+    parser.add_argument('--workers', type=int, default=4, help="parallel downloads")
+    parser.add_argument('--full', action='store_true', help="re-check every observation, not just new releases")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be downloaded")
+    args = parser.parse_args(argv)
+
+    summary = sync(args.targets, args.dir, args.manifest, args.workers, args.dry_run,
+                   obs_collection=args.collection, instrument_name=args.instrument,
+                   calib_level=args.calib_level, filter_names=args.filters,
+                   extension=args.extension or None, radius=args.radius,
+                   data_rights=args.data_rights or None, full=args.full)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    status = main()
+    if metrics.enabled:
+        print(metrics.summary())
+    sys.exit(status)
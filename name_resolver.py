@@ -1,5 +1,7 @@
-from mast_request import mast_query
-from utils import json, pp
+from mast_request import mast_query, decode_response
+from utils import logging
+
+log = logging.getLogger(__name__)
 
 def resolve_object(object_name):
     resolver_request = {
@@ -7,8 +9,8 @@ def resolve_object(object_name):
         'params': {'input': object_name, 'format': 'json'}
     }
     headers, resolved_object_string = mast_query(resolver_request)
-    resolved_object = json.loads(resolved_object_string)
-    pp.pprint(resolved_object)
+    resolved_object = decode_response(resolved_object_string, resolver_request['service'])
+    log.debug("resolved %s: %s", object_name, resolved_object)
     ra = resolved_object['resolvedCoordinate'][0]['ra']
     dec = resolved_object['resolvedCoordinate'][0]['decl']
     return ra, dec
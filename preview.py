@@ -0,0 +1,86 @@
+# Small PNG/JPEG previews of downloaded FITS images.
+#
+# A preview never loads the full image: the pixels are memory-mapped and
+# either strided (only every n-th row and column is read) or block-averaged
+# a band of rows at a time, down to about PREVIEW_SIZE on the long side.
+# The display range comes from percentiles of that small array, and the
+# result is written with matplotlib's Agg renderer (no GUI) next to the
+# product, where later calls find it and return straight away.
+
+import os
+import hashlib
+import numpy as np
+from astropy.io import fits
+from matplotlib import image as mpimg
+from metrics import span
+
+PREVIEW_SIZE = 1024
+PREVIEW_FORMATS = ('png', 'jpg')
+
+
+def preview_path(path, size=PREVIEW_SIZE, fmt='png', **settings):
+    # cached preview location: next to the product, keyed by size, format and
+    # a short digest of the other rendering settings (method, percentiles, ...)
+    stamp = hashlib.sha1(repr(sorted(settings.items())).encode()).hexdigest()[:8]
+    return f"{path}.preview{size}-{stamp}.{fmt}"
+
+def image_hdu(hdul, ext=None):
+    # the requested extension, else SCI, else the first HDU holding an image
+    if ext is not None:
+        return hdul[ext]
+    if 'SCI' in hdul:
+        return hdul['SCI']
+    for hdu in hdul:
+        if hdu.header.get('NAXIS', 0) >= 2:
+            return hdu
+    raise ValueError("no image data found in any extension")
+
+def downsample(data, size=PREVIEW_SIZE, method='stride'):
+    # about size pixels on the long side; 'stride' reads 1/factor of the rows,
+    # 'mean' reads everything but only factor rows at a time
+    while data.ndim > 2:
+        data = data[0]
+    factor = max(1, -(-max(data.shape) // size))
+    if factor == 1:
+        return np.array(data, dtype=np.float32)
+    if method == 'stride':
+        return np.array(data[::factor, ::factor], dtype=np.float32)
+    if method != 'mean':
+        raise ValueError(f"unknown downsample method {method!r}")
+    ny, nx = data.shape[0] // factor, data.shape[1] // factor
+    out = np.empty((ny, nx), dtype=np.float32)
+    for j in range(ny):
+        band = np.array(data[j*factor:(j+1)*factor, :nx*factor], dtype=np.float32)
+        band = band.reshape(factor, nx, factor)
+        good = np.isfinite(band)
+        total = np.where(good, band, 0).sum(axis=(0, 2))
+        n = good.sum(axis=(0, 2))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[j] = np.where(n > 0, total / n, np.nan)
+    return out
+
+def display_range(small, lo=5, hi=99):
+    # (vmin, vmax) at percentiles of the finite pixels of a preview array
+    finite = small[np.isfinite(small)]
+    if finite.size == 0:
+        return 0.0, 1.0
+    vmin, vmax = np.percentile(finite, [lo, hi])
+    return float(vmin), float(vmax)
+
+def make_preview(path, size=PREVIEW_SIZE, fmt='png', method='stride', percentiles=(5, 99),
+                 cmap='inferno', ext=None, force=False):
+    # write (or reuse) the preview of a FITS file and return its path
+    if fmt not in PREVIEW_FORMATS:
+        raise ValueError(f"unsupported preview format {fmt!r}")
+    out = preview_path(path, size, fmt, method=method, percentiles=tuple(percentiles), cmap=cmap, ext=ext)
+    if not force and os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(path):
+        return out
+    with span('preview', method=method):
+        with fits.open(path, memmap=True, lazy_load_hdus=True) as hdul:
+            small = downsample(image_hdu(hdul, ext).data, size, method)
+        vmin, vmax = display_range(small, *percentiles)
+        tmp = out + '.tmp'
+        mpimg.imsave(tmp, small, vmin=vmin, vmax=vmax, cmap=cmap, origin='lower',
+                     format='jpeg' if fmt == 'jpg' else fmt)
+        os.replace(tmp, out)
+    return out
@@ -1,11 +1,12 @@
 # Program to read i2d fits files containing images from the 
 # James Webb Space Telescope (JWST) to create false-color 
 # images. 
+#
+# The read/reproject/stretch/write stages live in false_color.py; this
+# script runs them for one RGB composite and displays the results.
 
-from astropy.io import fits
-from astropy.wcs import WCS
-from reproject import reproject_interp
-import tifffile
+from false_color import Pipeline
+from stretch import channel_range
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -31,135 +32,107 @@ fits_files = ['/Users/trevormartinez/Downloads/MAST_2025-06-12T2108/JWST/jw01714
 fwhite = [0.0012, 0.0025,0.005]
 fblack = [0.0006, 0.00045,0.0002]
 
+# stretch applied between the black and white points: 'linear', 'asinh' or 'log'
+stretch_kind = 'linear'
+
 # specify which filter should be used as the reference for coordinate transformations
 ref_indx = 0   # use filter 0 (i.e. red) as the reference
 
+# output frame: 'ref' keeps the whole reference image; 'intersection' crops it
+# to where every filter has data (e.g. a small MIRI field inside a NIRCam one).
+# Either way only the part of the frame each file covers is reprojected.
+frame = 'ref'
+
+# reprojection runs in a process pool over tiles of the output image
+workers   = None   # number of worker processes (None = one per CPU)
+tile_size = 2048   # output tile edge in pixels
+
+# reprojected channels are cached on disk, so re-running with a new stretch
+# skips the reprojection (set to None to disable)
+reproject_cache_dir = '.reproject_cache'
+
+# output is written as a tiled BigTIFF
+tiff_tile        = 512    # tile edge in pixels
+tiff_compression = None   # e.g. 'zlib' or 'zstd'
+tiff_levels      = 0      # number of 2x-downsampled pyramid levels
+
+
+def main():
+    with Pipeline(workers, tile_size, reproject_cache_dir) as pipe:
+        render(pipe)
+
+
+def render(pipe):
+    #----------------  Read in i2d FITS  --------------------
+
+    # i2d headers; SCI pixels are memory-mapped, not loaded
+    image  = [pipe.image(f) for f in fits_files]
+    header = [im.header for im in image]
+    data   = [im.data for im in image]
+
+
+    #----------------  Project onto common coordinate frame  --------------------
+
+    # project files onto coordinate system of file ref_indx; every channel
+    # and output tile is reprojected in parallel and stitched back together
+    box = pipe.frame(fits_files, fits_files[ref_indx], frame)
+    R, G, B = [pipe.channel(f, fits_files[ref_indx], box=box) for f in fits_files]
+
+
+    #----------------  Display raw tiff files  --------------------
 
-#----------------  Read in i2d FITS  --------------------
-
-# preallocate space for fits data
-hdu    = [None] * len(fits_files)
-header = [None] * len(fits_files)
-data   = [None] * len(fits_files)
-wcs    = [None] * len(fits_files)
-
-# read in i2d fits files
-for j in range(len(fits_files)):
-    hdu[j] = fits.open(fits_files[j])
-    header[j] = hdu[j]['SCI'].header
-    data[j] = hdu[j]['SCI'].data
-    wcs[j] = WCS(header[j])
-
-
-#----------------  Project onto common coordinate frame  --------------------
-
-# project files 1 and 2 onto coordinate system of file 0
-if ref_indx == 0:
-    R = data[0]
-    G,_=reproject_interp((data[1], wcs[1]), wcs[0], shape_out=data[0].shape)
-    B,_=reproject_interp((data[2], wcs[2]), wcs[0], shape_out=data[0].shape)
-elif ref_indx == 1:
-    G = data[1]
-    R,_=reproject_interp((data[0], wcs[0]), wcs[1], shape_out=data[1].shape)
-    B,_=reproject_interp((data[2], wcs[2]), wcs[1], shape_out=data[1].shape)
-else:
-    B = data[2]
-    G,_=reproject_interp((data[1], wcs[1]), wcs[2], shape_out=data[2].shape)
-    R,_=reproject_interp((data[0], wcs[0]), wcs[2], shape_out=data[2].shape)
-
-
-
-
-# # Display the array as an image
-# fig,ax = plt.subplots() 
-# plt.imshow(a, cmap='gray',vmin=vmin+vrange*fblack[0],vmax=vmin+vrange*fblack[0]+vmax*f[0])  # Use a colormap like 'viridis', 'gray', etc.
-# # plt.colorbar()  # Add a colorbar to show value-to-color mapping
-# ax.set_axis_off()
-# plt.title('comb')
-# plt.show()
-    
-    
-
-#----------------  Display raw tiff files  --------------------
-
-for j,hd in enumerate(hdu):
-    # print("image size = ",hd['SCI'].header['NAXIS2']," x ",hd['SCI'].header['NAXIS2']," pix arc sec ",np.sqrt(hd['SCI'].header['PIXAR_A2']))
-    print("image size = ",header[j]['NAXIS2']," x ",header[j]['NAXIS2']," pix arc sec ",np.sqrt(header[j]['PIXAR_A2']))
-
-    # get image data
-    # data = hd['SCI'].data
-    
-    # find pixel value min, max and range
-    vmin = np.nanmin(data[j])
-    vmax = np.nanmax(data[j])
-    vrange = vmax-vmin
-    
-    # Display the array as an image
+    for j in range(len(fits_files)):
+        # print("image size = ",hd['SCI'].header['NAXIS2']," x ",hd['SCI'].header['NAXIS2']," pix arc sec ",np.sqrt(hd['SCI'].header['PIXAR_A2']))
+        print("image size = ",header[j]['NAXIS2']," x ",header[j]['NAXIS2']," pix arc sec ",np.sqrt(header[j]['PIXAR_A2']))
+
+        # get image data
+        # data = hd['SCI'].data
+
+        # find pixel value min, max and range, streaming over the memory map
+        vmin, vmax = channel_range(data[j])
+        vrange = vmax-vmin
+
+        # Display a downsampled copy of the array, like the composite below
+        step = max(1, data[j].shape[1] // 2000)
+        fig,ax = plt.subplots() 
+        plt.imshow(data[j][::step, ::step], cmap='gray',vmin=vmin+vrange*fblack[j],vmax=vmin+vrange*fwhite[j])  # Use a colormap like 'viridis', 'gray', etc.
+
+        # plt.imshow(data[j], cmap='gray',vmin=vmin,vmax=vmin+vmax*f[j])  # Use a colormap like 'viridis', 'gray', etc.
+        # plt.colorbar()  # Add a colorbar to show value-to-color mapping
+        ax.set_axis_off()
+        plt.title('Ring Nebula')
+        plt.show()
+
+
+    # normalize each channel using to_unit16 function
+    r_16 = pipe.stretch(R,fblack[0],fwhite[0],stretch_kind)
+    g_16 = pipe.stretch(G,fblack[1],fwhite[1],stretch_kind)
+    b_16 = pipe.stretch(B,fblack[2],fwhite[2],stretch_kind)
+
+    # Save 16-bit RGB TIFF; the RGB stack is assembled one tile at a time
+    pipe.write('image_rgb_16bit.tiff', [r_16, g_16, b_16], tiff_tile, tiff_compression, tiff_levels)
+
+
+    #----------------  Display color filter combo  --------------------
+
+    # Display a downsampled copy of the composite; the screen can't show more anyway
+    step = max(1, r_16.shape[1] // 2000)
+    rgb_16 = np.stack([r_16[::step, ::step], g_16[::step, ::step], b_16[::step, ::step]], axis=-1)
     fig,ax = plt.subplots() 
-    plt.imshow(data[j], cmap='gray',vmin=vmin+vrange*fblack[j],vmax=vmin+vrange*fwhite[j])  # Use a colormap like 'viridis', 'gray', etc.
+    plt.imshow(rgb_16.astype(float)/65535)  # Use a colormap like 'viridis', 'gray', etc.
 
-    # plt.imshow(data[j], cmap='gray',vmin=vmin,vmax=vmin+vmax*f[j])  # Use a colormap like 'viridis', 'gray', etc.
-    # plt.colorbar()  # Add a colorbar to show value-to-color mapping
     ax.set_axis_off()
     plt.title('Ring Nebula')
     plt.show()
-    
-    
-#----------------  Convert to tiff file  --------------------
 
-# normalize each channel to range 0 - 65535 for 16-bit tiff
-#
-def to_uint16(channel,fblk,fwht):
-    # find pixel value min, max and range
-    vmin = np.nanmin(channel)
-    vmax = np.nanmax(channel)
-    vrange = vmax-vmin
-    
-    # replace missing pixel values with 0
-    channel = np.nan_to_num(channel)
-
-    # calculate black and white points
-    blk = vmin + vrange*fblk
-    wht = vmin + vrange*fwht
-    
-    # ensure pixel values are between black and white point
-    norm = channel
-    norm[norm<blk] = blk
-    norm[norm>wht] = wht
-    
-    # return image with pixel values between 0 - 65535 
-    norm = (norm - blk) / (wht - blk + 1e-6)
-    return (norm * 65535).astype(np.uint16)
-
-# normalize each channel using to_unit16 function
-r_16 = to_uint16(R,fblack[0],fwhite[0])
-g_16 = to_uint16(G,fblack[1],fwhite[1])
-b_16 = to_uint16(B,fblack[2],fwhite[2])
-
-# Stack into RGB format: shape (H, W, 3)
-rgb_16 = np.stack([r_16, g_16, b_16], axis=-1)
-
-# Save 16-bit RGB TIFF
-tifffile.imwrite('image_rgb_16bit.tiff', rgb_16)
-
-
-#----------------  Display color filter combo  --------------------
-
-# Display the array as an image
-fig,ax = plt.subplots() 
-plt.imshow(rgb_16.astype(float)/65535)  # Use a colormap like 'viridis', 'gray', etc.
-
-ax.set_axis_off()
-plt.title('Ring Nebula')
-plt.show()
-    
-#----------------  plot histogram of each RGB filter  --------------------
-
-plt.hist(r_16.flatten(),bins=50,color='r')
-plt.hist(g_16.flatten(),bins=50,color='g')
-plt.hist(b_16.flatten(),bins=50,color='b')
-# # plt.grid(True)
-plt.show()
-
-
-    
\ No newline at end of file
+    #----------------  plot histogram of each RGB filter  --------------------
+
+    plt.hist(r_16.ravel(),bins=50,color='r')
+    plt.hist(g_16.ravel(),bins=50,color='g')
+    plt.hist(b_16.ravel(),bins=50,color='b')
+    # # plt.grid(True)
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Content-addressed on-disk cache of reprojected channels.
+#
+# A channel is keyed on a hash of the input file's bytes, the reference
+# WCS, the output shape and the interpolation order, so changing only the
+# stretch reuses the previous reprojection. Arrays are stored as .npy and
+# reloaded memory-mapped; least recently used entries are evicted once the
+# cache grows past max_bytes.
+
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class ReprojectCache:
+
+    def __init__(self, path='.reproject_cache', max_bytes=20 * 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        # file content hashes, reused while (size, mtime) is unchanged
+        self._index_file = os.path.join(path, 'file_hashes.json')
+        try:
+            with open(self._index_file) as f:
+                self._hashes = json.load(f)
+        except (OSError, ValueError):
+            self._hashes = {}
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        known = self._hashes.get(path)
+        if known and known['stamp'] == stamp:
+            return known['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        with self._lock:
+            self._hashes[path] = {'stamp': stamp, 'sha256': digest.hexdigest()}
+            with open(self._index_file, 'w') as f:
+                json.dump(self._hashes, f)
+        return digest.hexdigest()
+
+    def key(self, path, wcs_out, shape_out, order):
+        parts = [self.file_hash(path), wcs_out.to_header_string(relax=True),
+                 repr(tuple(shape_out)), str(order)]
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npy')
+
+    def get(self, key):
+        # memory-mapped cached array, or None
+        file = self._file(key)
+        if not os.path.exists(file):
+            self.misses += 1
+            return None
+        try:
+            os.utime(file)
+            array = np.load(file, mmap_mode='r')
+        except FileNotFoundError:
+            # evicted in the meantime
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array
+
+    def put(self, key, array):
+        file = self._file(key)
+        # the suffix keeps the partial file out of evict's view
+        tmp = f'{file}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, file)
+        self.evict()
+
+    def evict(self):
+        # remove least recently used arrays until under max_bytes
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.path):
+                if not entry.name.endswith('.npy'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                total -= size
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        for entry in os.scandir(self.path):
+            os.remove(entry.path)
+        self._hashes = {}
@@ -0,0 +1,127 @@
+# Parallel, tiled reprojection of FITS channels onto a reference WCS.
+#
+# Every (channel, output tile) pair is an independent job in a process
+# pool. Workers memory-map the inputs themselves, so only file paths, the
+# tile WCS and the finished tiles cross process boundaries. Interpolation
+# is per output pixel, so stitched tiles match a full-frame reprojection.
+# Only tiles inside an input's footprint (see footprint.py) are computed;
+# the rest of the output is NaN without any work.
+
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+from reproject import reproject_interp
+from fits_loader import SciImage
+from footprint import footprint_box, full_box, common_box, crop_frame, box_shape
+from metrics import span
+
+# inputs opened by this worker process, least recently used first; the
+# oldest is closed (memory map and file handle) once there are too many
+MAX_OPEN_IMAGES = 8
+_images = OrderedDict()
+
+def _image(path, ext):
+    key = (path, ext)
+    if key in _images:
+        _images.move_to_end(key)
+        return _images[key]
+    while len(_images) >= MAX_OPEN_IMAGES:
+        _, old = _images.popitem(last=False)
+        old.close()
+    image = _images[key] = SciImage(path, ext)
+    return image
+
+def tile_slices(shape, tile_size, box=None):
+    # (rows, cols) slices covering shape, or just box within it, in tile_size blocks
+    rows, cols = box or full_box(shape)
+    return [(slice(y, min(y + tile_size, rows.stop)), slice(x, min(x + tile_size, cols.stop)))
+            for y in range(rows.start, rows.stop, tile_size)
+            for x in range(cols.start, cols.stop, tile_size)]
+
+def reproject_tile(path, wcs_out, rows, cols, order='bilinear', ext='SCI'):
+    # reproject one input onto the (rows, cols) block of the output frame
+    image = _image(path, ext)
+    shape = (rows.stop - rows.start, cols.stop - cols.start)
+    tile, _ = reproject_interp((image.data, image.wcs), wcs_out[rows, cols],
+                               shape_out=shape, order=order)
+    return tile.astype(np.float32, copy=False)
+
+def reproject_channel(path, wcs_out, shape_out, pool, tile_size=2048, order='bilinear',
+                      ext='SCI', cache=None, crop=True):
+    # reproject one file onto wcs_out/shape_out, farming its tiles out to
+    # pool (a ProcessPoolExecutor that may be shared with other channels).
+    # With crop, only the bounding box of the file's footprint is reprojected.
+    with span('reproject') as sp:
+        if cache is not None:
+            key = cache.key(path, wcs_out, shape_out, order)
+            cached = cache.get(key)
+            if cached is not None:
+                sp.set(cache='hit')
+                return cached
+        box = full_box(shape_out)
+        if crop:
+            with SciImage(path, ext) as image:
+                box = footprint_box(image.wcs, image.shape, wcs_out, shape_out)
+        out = np.full(shape_out, np.nan, dtype=np.float32)
+        tiles = tile_slices(shape_out, tile_size, box) if box is not None else []
+        futures = {pool.submit(reproject_tile, path, wcs_out, rows, cols, order, ext): (rows, cols)
+                   for rows, cols in tiles}
+        sp.add('tiles', len(futures))
+        if box is not None:
+            sp.add('pixels', box_shape(box)[0] * box_shape(box)[1])
+        for future in as_completed(futures):
+            rows, cols = futures[future]
+            out[rows, cols] = future.result()
+        if cache is not None:
+            cache.put(key, out)
+        return out
+
+def frame_box(paths, ref_indx=0, frame='ref', ext='SCI'):
+    # box of paths[ref_indx]'s frame chosen as the common output frame,
+    # from the headers alone (see footprint.common_box)
+    images = []
+    for path in paths:
+        with SciImage(path, ext) as image:
+            images.append((image.wcs, image.shape))
+    return common_box(images, ref_indx, frame)
+
+def reproject_channels(paths, ref_indx=0, shape_out=None, wcs_out=None, workers=None,
+                       tile_size=2048, order='bilinear', ext='SCI', cache=None, pool=None,
+                       frame='ref'):
+    # reproject every file in paths onto the frame of paths[ref_indx]
+    # (or onto wcs_out/shape_out when given); returns float32 arrays in order.
+    # frame='intersection' instead crops the reference frame to where every
+    # input has coverage (see frame_box).
+    # With a ReprojectCache, previously reprojected channels are reloaded
+    # memory-mapped instead of recomputed.
+    with SciImage(paths[ref_indx], ext) as ref:
+        wcs_out = ref.wcs if wcs_out is None else wcs_out
+        shape_out = ref.shape if shape_out is None else shape_out
+        box = None
+        if frame != 'ref':
+            box = frame_box(paths, ref_indx, frame, ext)
+            wcs_out, shape_out = crop_frame(ref.wcs, box)
+        out = [None] * len(paths)
+        if wcs_out is ref.wcs and shape_out == ref.shape:
+            out[ref_indx] = np.array(ref.data, dtype=np.float32)
+        elif box is not None:
+            out[ref_indx] = np.array(ref.data[box], dtype=np.float32)
+
+    jobs = [j for j in range(len(paths)) if out[j] is None]
+    if not jobs:
+        return out
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    try:
+        # one thread per channel keeps every channel's tiles queued in the pool at once
+        with ThreadPoolExecutor(max_workers=len(jobs)) as threads:
+            results = threads.map(lambda j: reproject_channel(paths[j], wcs_out, shape_out, pool,
+                                                              tile_size, order, ext, cache), jobs)
+            for j, result in zip(jobs, results):
+                out[j] = result
+    finally:
+        if own_pool:
+            pool.shutdown()
+    return out
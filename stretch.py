@@ -0,0 +1,81 @@
+# Low-memory stretch engine for 16-bit false-color channels.
+#
+# Statistics come from one streaming pass (np.fmin/np.fmax ignore NaN
+# without copying), and the clip/scale is done chunk by chunk in float32,
+# written straight into a preallocated uint16 output. Percentile stretches
+# estimate their limits from a strided subsample of the image.
+
+import numpy as np
+from metrics import span
+
+CHUNK_ROWS = 512
+SAMPLE_SIZE = 1_000_000
+
+
+def _chunks(nrows, chunk_rows):
+    for y in range(0, nrows, chunk_rows):
+        yield slice(y, min(y + chunk_rows, nrows))
+
+def channel_range(channel, chunk_rows=CHUNK_ROWS):
+    # NaN-ignoring (min, max) in a single pass over the channel
+    vmin, vmax = np.inf, -np.inf
+    for rows in _chunks(channel.shape[0], chunk_rows):
+        chunk = channel[rows]
+        vmin = np.fmin(vmin, np.fmin.reduce(chunk, axis=None))
+        vmax = np.fmax(vmax, np.fmax.reduce(chunk, axis=None))
+    return float(vmin), float(vmax)
+
+def sample(channel, size=SAMPLE_SIZE):
+    # strided subsample of about size pixels
+    step = max(1, int(np.sqrt(channel.size / size)))
+    return channel[::step, ::step]
+
+def sample_percentiles(channel, lo, hi, size=SAMPLE_SIZE):
+    # (lo, hi) percentiles of the channel estimated from a subsample
+    pct = np.nanpercentile(np.asarray(sample(channel, size), dtype=np.float32), [lo, hi])
+    return float(pct[0]), float(pct[1])
+
+def stretch(channel, blk, wht, kind='linear', out=None, chunk_rows=CHUNK_ROWS, a=0.1):
+    # map [blk, wht] onto 0 - 65535 in uint16; NaN pixels become blk.
+    # kind is 'linear', 'asinh' (a = softening) or 'log' (a = 1/scale).
+    with span('stretch', kind=kind):
+        return _stretch(channel, blk, wht, kind, out, chunk_rows, a)
+
+def _stretch(channel, blk, wht, kind, out, chunk_rows, a):
+    if out is None:
+        out = np.empty(channel.shape, dtype=np.uint16)
+    scale = 1.0 / (wht - blk + 1e-6)
+    if kind == 'asinh':
+        norm = 1.0 / np.arcsinh(1.0 / a)
+    elif kind == 'log':
+        norm = 1.0 / np.log1p(1.0 / a)
+    elif kind != 'linear':
+        raise ValueError(f"unknown stretch {kind!r}")
+    for rows in _chunks(channel.shape[0], chunk_rows):
+        tmp = np.array(channel[rows], dtype=np.float32)
+        np.nan_to_num(tmp, copy=False, nan=0.0)
+        np.clip(tmp, blk, wht, out=tmp)
+        tmp -= blk
+        tmp *= scale
+        if kind == 'asinh':
+            tmp /= a
+            np.arcsinh(tmp, out=tmp)
+            tmp *= norm
+        elif kind == 'log':
+            tmp /= a
+            np.log1p(tmp, out=tmp)
+            tmp *= norm
+        tmp *= 65535
+        np.copyto(out[rows], tmp, casting='unsafe')
+    return out
+
+def to_uint16(channel, fblk, fwht, kind='linear', out=None):
+    # black/white points as fractions of the channel's [min, max] range
+    vmin, vmax = channel_range(channel)
+    vrange = vmax - vmin
+    return stretch(channel, vmin + vrange*fblk, vmin + vrange*fwht, kind, out)
+
+def percentile_to_uint16(channel, plo=0.5, phi=99.5, kind='linear', out=None):
+    # black/white points at sampled percentiles of the channel
+    blk, wht = sample_percentiles(channel, plo, phi)
+    return stretch(channel, blk, wht, kind, out)
@@ -0,0 +1,48 @@
+# Tiled BigTIFF writer for false-color products.
+#
+# Channels are streamed to disk one tile at a time: RGB composites are
+# assembled per tile, so the full H x W x 3 stack is never held in memory.
+# Optional reduced-resolution levels are written as SubIFDs, which lets
+# viewers open very large composites at a low zoom instantly.
+
+import numpy as np
+import tifffile
+from metrics import span
+
+
+def _tiles(channels, tile, step=1):
+    # yield tiles of the (optionally strided) channels in row-major order
+    ny, nx = channels[0][::step, ::step].shape
+    for y in range(0, ny, tile):
+        for x in range(0, nx, tile):
+            rows = slice(y * step, min(y + tile, ny) * step, step)
+            cols = slice(x * step, min(x + tile, nx) * step, step)
+            if len(channels) == 1:
+                yield np.ascontiguousarray(channels[0][rows, cols])
+            else:
+                yield np.stack([c[rows, cols] for c in channels], axis=-1)
+
+def write_tiled(path, channels, tile=512, compression=None, levels=0):
+    # write one channel (grayscale) or three channels (RGB) as a tiled
+    # BigTIFF; levels adds that many 2x-downsampled pyramid levels
+    if isinstance(channels, np.ndarray) and channels.ndim == 2:
+        channels = [channels]
+    channels = list(channels)
+    ny, nx = channels[0].shape
+    photometric = 'minisblack' if len(channels) == 1 else 'rgb'
+    with span('tiff_write'), tifffile.TiffWriter(path, bigtiff=True) as tif:
+        for level in range(levels + 1):
+            step = 2 ** level
+            shape = (-(-ny // step), -(-nx // step))
+            if len(channels) > 1:
+                shape += (len(channels),)
+            tif.write(
+                _tiles(channels, tile, step),
+                shape=shape,
+                dtype=channels[0].dtype,
+                tile=(tile, tile),
+                photometric=photometric,
+                compression=compression,
+                subifds=levels if level == 0 else None,
+                subfiletype=1 if level else 0,
+            )
@@ -1,9 +1,39 @@
+import os
 import sys
+import time
+import re
+import sqlite3
+import gzip
+import hashlib
+import threading
+import asyncio
 import json
-import pprint
-import numpy as np
-from astropy.table import Table
+import codecs
+import logging
+import importlib
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from email.utils import parsedate_to_datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import quote as urlencode
 
-pp = pprint.PrettyPrinter(indent=4)
+# slow to import and needed only by some paths, so loaded on first use
+_LAZY = {
+    'np': ('numpy', None),
+    'Table': ('astropy.table', 'Table'),
+    'MaskedColumn': ('astropy.table', 'MaskedColumn'),
+    'vstack': ('astropy.table', 'vstack'),
+    'httpx': ('httpx', None),
+}
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attr = _LAZY[name]
+    value = importlib.import_module(module)
+    if attr is not None:
+        value = getattr(value, attr)
+    globals()[name] = value
+    return value